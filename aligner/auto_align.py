@@ -0,0 +1,289 @@
+import numpy as np
+import pandas as pd
+
+from aligner.utils import timestamp_to_elapsed
+
+DRIFT_RESIDUAL_THRESHOLD = 0.1
+DRIFT_WARNING = 'Clock drift fit residuals were large, alignments do not match across recording'
+
+
+def median_sample_interval(time):
+    """Typical spacing between consecutive samples, in the units of time"""
+    return float(np.median(np.diff(time)))
+
+
+def resample_to_grid(time, values, t0, dt, n):
+    """
+    Bin-average a (possibly irregularly sampled) time series onto a regular grid
+
+    Averaging every sample that falls into a grid bin acts as a simple anti-aliasing filter when the grid is coarser
+    than the data. Bins that receive no samples are filled by linear interpolation from their neighbours.
+
+    :param time: sorted 1-D array of sample times, in seconds
+    :param values: 1-D array of sample values
+    :param t0: time of the first grid point
+    :param dt: grid spacing, in seconds
+    :param n: number of grid points
+    :return: array of n values on the grid. All NaN if no samples fell on the grid
+    """
+    idx = np.floor((np.asarray(time) - t0) / dt).astype(np.int64)
+    valid = (idx >= 0) & (idx < n) & np.isfinite(values)
+    counts = np.bincount(idx[valid], minlength=n)
+    sums = np.bincount(idx[valid], weights=np.asarray(values)[valid], minlength=n)
+
+    filled = counts > 0
+    if not filled.any():
+        return np.full(n, np.nan)
+    grid = np.empty(n)
+    grid[filled] = sums[filled] / counts[filled]
+    grid[~filled] = np.interp(np.flatnonzero(~filled), np.flatnonzero(filled), grid[filled])
+    return grid
+
+
+def zscore(values):
+    """Zero-mean, unit-variance copy of the values, with missing values set to 0 so they don't correlate"""
+    std = np.nanstd(values)
+    normed = (values - np.nanmean(values)) / (std if std > 0 else 1.0)
+    normed[np.isnan(normed)] = 0.0
+    return normed
+
+
+def normalized_xcorr(x, y, min_overlap=0.25):
+    """
+    Normalized cross-correlation of two signals at every lag, computed with FFTs
+
+    Each lag is normalized by the energy of both signals over the samples that actually overlap at that lag, so that
+    partial overlaps are not penalized just for being short.
+
+    :param x: 1-D reference signal
+    :param y: 1-D signal to align to the reference
+    :param min_overlap: fraction of the shorter signal that must overlap for a lag to be considered
+    :return: tuple of (lags, ncc). At lag k, y[n] lines up with x[n + k]. ncc is NaN where the overlap is too small
+    """
+    nx, ny = len(x), len(y)
+    n_fft = 1 << int(np.ceil(np.log2(nx + ny - 1)))
+    corr = np.fft.irfft(np.fft.rfft(x, n_fft) * np.conj(np.fft.rfft(y, n_fft)), n_fft)
+    corr = np.concatenate([corr[n_fft - (ny - 1):], corr[:nx]])
+    lags = np.arange(-(ny - 1), nx)
+
+    # Energy of each signal over the overlapping region, from cumulative sums
+    ex = np.concatenate([[0.0], np.cumsum(x ** 2)])
+    ey = np.concatenate([[0.0], np.cumsum(y ** 2)])
+    xa, xb = np.clip(lags, 0, nx), np.clip(lags + ny, 0, nx)
+    ya, yb = np.clip(-lags, 0, ny), np.clip(nx - lags, 0, ny)
+    energy = (ex[xb] - ex[xa]) * (ey[yb] - ey[ya])
+
+    usable = np.logical_and(xb - xa >= min_overlap * min(nx, ny), energy > 0)
+    ncc = np.full(len(lags), np.nan)
+    ncc[usable] = corr[usable] / np.sqrt(energy[usable])
+    return lags, ncc
+
+
+def estimate_lag(ref_time, ref_values, time, values, sample_rate=None, search_window=None, min_overlap=0.25,
+                 exclusion=1.0):
+    """
+    Estimate the time offset that aligns one stream to a reference stream
+
+    Both streams are resampled onto a common grid, z-scored and cross-correlated with FFTs. The returned offset follows
+    the same convention as the GUI: adding it to the stream's times puts the stream in the reference's time.
+
+    :param ref_time: sorted sample times of the reference ('true' time) stream, in seconds
+    :param ref_values: sample values of the reference stream
+    :param time: sorted sample times of the stream to align, in seconds, on the same clock as ref_time
+    :param values: sample values of the stream to align
+    :param sample_rate: rate of the common grid, in Hz. Defaults to the lower of the two streams' rates, capped at 50 Hz
+    :param search_window: optional (min_offset, max_offset) tuple, in seconds, limiting the offsets considered
+    :param min_overlap: fraction of the shorter stream that must overlap the reference for an offset to be considered
+    :param exclusion: half-width, in seconds, of the region around the best offset ignored when looking for the
+        runner-up peak
+    :return: tuple of (offset, confidence). The confidence is the normalized correlation at the best offset minus that
+        of the best competing offset further than `exclusion` away, so it is near 0 when the choice is ambiguous and
+        approaches 1 for a single clean match
+    """
+    ref_time, ref_values = np.asarray(ref_time, dtype=float), np.asarray(ref_values, dtype=float)
+    time, values = np.asarray(time, dtype=float), np.asarray(values, dtype=float)
+    if sample_rate is None:
+        sample_rate = min(1 / median_sample_interval(ref_time), 1 / median_sample_interval(time), 50.0)
+    dt = 1.0 / sample_rate
+
+    n_ref = int((ref_time[-1] - ref_time[0]) / dt) + 1
+    n = int((time[-1] - time[0]) / dt) + 1
+    x = zscore(resample_to_grid(ref_time, ref_values, ref_time[0], dt, n_ref))
+    y = zscore(resample_to_grid(time, values, time[0], dt, n))
+
+    lags, ncc = normalized_xcorr(x, y, min_overlap=min_overlap)
+    offsets = ref_time[0] - time[0] + lags * dt
+    if search_window is not None:
+        ncc[np.logical_or(offsets < search_window[0], offsets > search_window[1])] = np.nan
+    if np.all(np.isnan(ncc)):
+        raise ValueError('No offsets with enough overlap to estimate an alignment')
+
+    best = int(np.nanargmax(ncc))
+    peak = ncc[best]
+
+    # Refine to sub-sample precision with a parabola through the peak and its neighbours
+    offset = offsets[best]
+    if 0 < best < len(ncc) - 1 and np.isfinite(ncc[best - 1]) and np.isfinite(ncc[best + 1]):
+        curvature = ncc[best - 1] - 2 * peak + ncc[best + 1]
+        if curvature < 0:
+            offset += 0.5 * (ncc[best - 1] - ncc[best + 1]) / curvature * dt
+
+    others = np.abs(offsets - offsets[best]) > exclusion
+    runner_up = np.nanmax(ncc[others]) if np.any(np.isfinite(ncc[others])) else 0.0
+    confidence = float(peak - max(runner_up, 0.0))
+    return float(offset), confidence
+
+
+def auto_align(true_time_data, search_window=None, **data_to_align):
+    """
+    Headless counterpart of manual_align: estimate the offset of every stream relative to the true time stream
+
+    As with manual_align, the first column of each DataFrame is used and every DataFrame is indexed by timestamps.
+
+    :param true_time_data: DataFrame containing data assumed to be 'correct' time
+    :param search_window: optional (min_offset, max_offset) tuple, in seconds, limiting the offsets considered
+    :param data_to_align: keyword arguments, each containing a DataFrame with the data to be time-aligned
+    :return: Dictionary of name: (pd.Timedelta offset, confidence)
+    """
+    start = true_time_data.index[0]
+    ref_time = timestamp_to_elapsed(true_time_data.index, start=start)
+    ref_values = true_time_data[true_time_data.columns[0]].to_numpy()
+
+    suggestions = {}
+    for name, data in data_to_align.items():
+        offset, confidence = estimate_lag(
+            ref_time, ref_values,
+            timestamp_to_elapsed(data.index, start=start), data[data.columns[0]].to_numpy(),
+            search_window=search_window
+        )
+        suggestions[name] = (pd.Timedelta(seconds=offset), confidence)
+    return suggestions
+
+
+def windowed_lags(x, y, window, max_lag, step, batch_size=256):
+    """
+    Best local lag of y against x in sliding windows, with all windows of a batch correlated in one FFT pass
+
+    :param x: 1-D reference signal
+    :param y: 1-D signal on the same grid as x (already shifted by any known global offset)
+    :param window: number of samples of y in each window
+    :param max_lag: largest lag, in samples, searched in either direction
+    :param step: number of samples between the starts of consecutive windows
+    :param batch_size: number of windows transformed at once, bounding the memory used
+    :return: tuple of (starts, lags, peaks): the first sample of every window, its best lag in (fractional) samples
+        such that y[n] lines up with x[n + lag], and the normalized correlation at that lag
+    """
+    n = min(len(x), len(y))
+    starts = np.arange(max_lag, n - window - max_lag + 1, step)
+    if not len(starts):
+        raise ValueError('Recording too short for the drift window')
+    n_lags = 2 * max_lag + 1
+    n_fft = 1 << int(np.ceil(np.log2(2 * window + 2 * max_lag - 1)))
+    x_segments = np.lib.stride_tricks.sliding_window_view(x, window + 2 * max_lag)
+    y_segments = np.lib.stride_tricks.sliding_window_view(y, window)
+
+    lags = np.empty(len(starts))
+    peaks = np.empty(len(starts))
+    for b in range(0, len(starts), batch_size):
+        batch = starts[b:b + batch_size]
+        xs, ys = x_segments[batch - max_lag], y_segments[batch]
+        corr = np.fft.irfft(np.fft.rfft(xs, n_fft) * np.conj(np.fft.rfft(ys, n_fft)), n_fft)[:, :n_lags]
+
+        # Energy of x under the window at every lag, and of the y window
+        ex = np.concatenate([np.zeros((len(batch), 1)), np.cumsum(xs ** 2, axis=1)], axis=1)
+        energy = (ex[:, window:window + n_lags] - ex[:, :n_lags]) * np.sum(ys ** 2, axis=1)[:, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ncc = np.where(energy > 0, corr / np.sqrt(energy), np.nan)
+
+        rows = np.arange(len(batch))
+        filled = np.where(np.isnan(ncc), -np.inf, ncc)
+        best = np.argmax(filled, axis=1)
+        peak = filled[rows, best]
+
+        # Parabolic sub-sample refinement, wherever the peak has a neighbour on both sides
+        inner = (best > 0) & (best < n_lags - 1)
+        left = filled[rows, np.maximum(best - 1, 0)]
+        right = filled[rows, np.minimum(best + 1, n_lags - 1)]
+        curvature = left - 2 * peak + right
+        refine = inner & (curvature < 0) & np.isfinite(curvature)
+        shift = np.zeros(len(batch))
+        shift[refine] = 0.5 * (left[refine] - right[refine]) / curvature[refine]
+
+        lags[b:b + batch_size] = best - max_lag + shift
+        # Peaks at the edge of the search range are not a real maximum
+        peaks[b:b + batch_size] = np.where(inner, peak, np.nan)
+    return starts, lags, peaks
+
+
+def estimate_drift(ref_time, ref_values, time, values, offset, window=60.0, step=None, max_lag=5.0, sample_rate=None,
+                   min_correlation=0.5, min_windows=3, min_fraction=0.25, max_outliers=0.1):
+    """
+    Estimate how the offset of a stream changes over the recording, by cross-correlating it in sliding windows
+
+    The stream is first put on the reference clock with a known global offset (e.g. from estimate_lag or a manual
+    alignment). Each window then finds the small extra lag that best aligns it locally, and a line fit through the
+    local offsets gives offset(t) = offset + drift * t, with t the reference time. Windows whose correlation is below
+    min_correlation (e.g. no movement) are ignored, and so are outliers more than three robust standard deviations from
+    a first fit. If more than max_outliers of the windows would be outliers, the offset is taken to change along the
+    recording instead (e.g. a clock jump), and every window is kept so that it shows in the residual.
+
+    :param ref_time: sorted sample times of the reference ('true' time) stream, in seconds
+    :param ref_values: sample values of the reference stream
+    :param time: sorted sample times of the stream to align, in seconds, on the same clock as ref_time
+    :param values: sample values of the stream to align
+    :param offset: global offset of the stream, in the same convention as estimate_lag
+    :param window: length of each window, in seconds
+    :param step: time between the starts of consecutive windows, in seconds. Defaults to half a window
+    :param max_lag: largest local deviation from the global offset searched for, in seconds
+    :param sample_rate: rate of the common grid, in Hz. Defaults to the lower of the two streams' rates, capped at 25 Hz
+    :param min_correlation: windows with a lower normalized correlation at their best lag are left out of the fit
+    :param min_windows: fewest windows to fit through. A line through two windows always fits them exactly, so its
+        residual says nothing about how well the offset holds across the recording
+    :param min_fraction: fewest windows to fit through, as a fraction of all the windows
+    :param max_outliers: largest fraction of the fitted windows that can be left out as outliers
+    :return: None if fewer than min_windows (or min_fraction of the) windows correlate well enough. Otherwise a
+        dictionary with the fitted 'offset' (at t = 0) and 'drift' (seconds per second), the RMS 'residual' of
+        the fit in seconds, and per window the center 'times', local 'offsets', 'correlations' and 'inliers' mask
+    """
+    ref_time, ref_values = np.asarray(ref_time, dtype=float), np.asarray(ref_values, dtype=float)
+    time, values = np.asarray(time, dtype=float) + offset, np.asarray(values, dtype=float)
+    if sample_rate is None:
+        sample_rate = min(1 / median_sample_interval(ref_time), 1 / median_sample_interval(time), 25.0)
+    dt = 1.0 / sample_rate
+    step = window / 2 if step is None else step
+
+    # Only the part of the recording covered by both streams is compared
+    t0, t1 = max(ref_time[0], time[0]), min(ref_time[-1], time[-1])
+    if t1 <= t0:
+        raise ValueError('The streams do not overlap at this offset')
+    n = int((t1 - t0) / dt) + 1
+    x = zscore(resample_to_grid(ref_time, ref_values, t0, dt, n))
+    y = zscore(resample_to_grid(time, values, t0, dt, n))
+
+    starts, lags, peaks = windowed_lags(
+        x, y, int(round(window / dt)), int(round(max_lag / dt)), max(int(round(step / dt)), 1))
+    times = t0 + (starts + window / dt / 2) * dt
+    local_offsets = offset + lags * dt
+
+    inliers = np.isfinite(peaks) & (peaks >= min_correlation)
+    if inliers.sum() < max(min_windows, int(np.ceil(min_fraction * len(starts)))):
+        return None
+    drift, intercept = np.polyfit(times[inliers], local_offsets[inliers], 1, w=peaks[inliers])
+
+    residuals = local_offsets - (intercept + drift * times)
+    spread = 1.4826 * np.median(np.abs(residuals[inliers]))
+    kept = inliers & (np.abs(residuals) <= max(3 * spread, 2 * dt))
+    if inliers.sum() - kept.sum() <= max_outliers * inliers.sum():
+        inliers = kept
+        drift, intercept = np.polyfit(times[inliers], local_offsets[inliers], 1, w=peaks[inliers])
+        residuals = local_offsets - (intercept + drift * times)
+
+    return {
+        'offset': float(intercept),
+        'drift': float(drift),
+        'residual': float(np.sqrt(np.mean(residuals[inliers] ** 2))),
+        'times': times,
+        'offsets': local_offsets,
+        'correlations': peaks,
+        'inliers': inliers,
+    }
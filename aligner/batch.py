@@ -0,0 +1,216 @@
+"""
+Headless batch alignment of many recording sessions
+
+Sessions are listed in a JSON manifest, each with a true time file and any number of named streams to align:
+
+    [
+        {
+            "name": "subject01_day1",
+            "true_time": {"path": "watch_accel.csv", "time_scale_to_seconds": 1},
+            "streams": {
+                "rcs_left": {"path": "rcs_left_accel.csv", "time_scale_to_seconds": 1000},
+                "rcs_right": {"path": "rcs_right_accel.csv", "time_scale_to_seconds": 1000}
+            }
+        }
+    ]
+
+A file can also be given as a bare path, in which case time_scale_to_seconds defaults to 1. Relative paths are taken
+relative to the manifest. Every session is loaded, normed and auto-aligned in a pool of worker processes. Sessions
+where any stream's confidence falls below the threshold can then be reviewed in the GUI with --review.
+
+Usage:
+    python -m aligner.batch manifest.json -o alignments.json [--workers 4] [--threshold 0.2] [--review]
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from aligner.auto_align import DRIFT_RESIDUAL_THRESHOLD, DRIFT_WARNING, auto_align, estimate_drift
+from aligner.gaps import MISSING_THRESHOLD, gap_index
+from aligner.utils import load_session, timestamp_to_elapsed
+
+LOW_CONFIDENCE_WARNING = 'Automatic alignment confidence was low and the alignment was not manually reviewed'
+MISSING_WARNING = 'Enough data was missing that this alignment is uncertain'
+
+
+def file_spec(spec, base_dir='.'):
+    """Normalize a manifest file entry into a (path, time_scale_to_seconds) tuple"""
+    if isinstance(spec, str):
+        spec = {'path': spec}
+    return os.path.join(base_dir, spec['path']), spec.get('time_scale_to_seconds', 1.0)
+
+
+def load_session_entry(session, base_dir='.', workers=None):
+    """
+    Load and norm every file in a manifest session, with aligner.utils.load_session
+
+    :param workers: number of files loaded at once. Defaults to one per file
+    :return: tuple of (true_time_data, data_to_align) ready to be passed to manual_align or auto_align
+    """
+    sources = {'true_time': file_spec(session['true_time'], base_dir)}
+    sources.update({name: file_spec(spec, base_dir) for name, spec in session['streams'].items()})
+    return load_session(sources, true_time='true_time', workers=workers)
+
+
+def align_session(session, base_dir='.', search_window=None, threshold=0.2,
+                  drift_threshold=DRIFT_RESIDUAL_THRESHOLD, missing_threshold=MISSING_THRESHOLD):
+    """
+    Automatically align one manifest session. Runs in a worker process
+
+    :return: dictionary with the alignments (in the same form manual_align returns them, drift included), the
+        confidence of every stream, and whether the session needs manual review. Streams that couldn't be aligned at
+        all (e.g. a flat stream, or a search window that excludes every offset) get a None offset and 0 confidence
+    """
+    # Sessions already load in parallel, one per worker process
+    true_time_data, data_to_align = load_session_entry(session, base_dir, workers=1)
+    alignments, confidence = {}, {}
+    for name, data in data_to_align.items():
+        try:
+            alignments[name], confidence[name] = auto_align(true_time_data, search_window=search_window,
+                                                            **{name: data})[name]
+        except ValueError:
+            alignments[name], confidence[name] = None, 0.0
+    needs_review = any(conf < threshold for conf in confidence.values())
+    warnings = {'auto alignment warning': LOW_CONFIDENCE_WARNING} if needs_review else {}
+
+    start = true_time_data.index[0]
+    ref_time = timestamp_to_elapsed(true_time_data.index, start=start)
+    drift, drifting = {}, []
+    for name, data in data_to_align.items():
+        if alignments[name] is None:
+            drift[name] = None
+            continue
+        try:
+            estimate = estimate_drift(
+                ref_time, true_time_data[true_time_data.columns[0]].to_numpy(),
+                timestamp_to_elapsed(data.index, start=start), data[data.columns[0]].to_numpy(),
+                alignments[name].total_seconds()
+            )
+        except ValueError:
+            estimate = None
+        if estimate is None:
+            drift[name] = None
+            continue
+        drift[name] = estimate['drift']
+        if estimate['residual'] > drift_threshold:
+            drifting.append(name)
+    if drifting:
+        warnings['shift warning'] = f"{DRIFT_WARNING}: {', '.join(drifting)}"
+
+    missing = [
+        name for name, data in {'true time': true_time_data, **data_to_align}.items()
+        if gap_index(timestamp_to_elapsed(data.index, start=start)).percent_missing > missing_threshold
+    ]
+    if missing:
+        warnings['data missing warning'] = f"{MISSING_WARNING}: {', '.join(missing)}"
+
+    alignments['drift'] = drift
+    alignments['warnings'] = warnings
+    alignments['comment'] = ''
+    return {'alignments': alignments, 'confidence': confidence, 'needs_review': needs_review, 'source': 'auto'}
+
+
+def review_session(session, base_dir='.'):
+    """Open the alignment GUI for one session and return its result in the same form as align_session"""
+    from aligner.gui import manual_align
+
+    true_time_data, data_to_align = load_session_entry(session, base_dir)
+    alignments = manual_align(true_time_data, **data_to_align)
+    return {'alignments': alignments, 'confidence': {}, 'needs_review': False, 'source': 'manual'}
+
+
+def run_batch(sessions, base_dir='.', workers=None, search_window=None, threshold=0.2,
+              drift_threshold=DRIFT_RESIDUAL_THRESHOLD, missing_threshold=MISSING_THRESHOLD):
+    """
+    Auto-align many sessions in parallel
+
+    :param sessions: list of manifest session dictionaries
+    :param base_dir: directory relative paths in the sessions are taken from
+    :param workers: number of worker processes. Defaults to the number of CPUs
+    :param search_window: optional (min_offset, max_offset) tuple, in seconds, limiting the offsets considered
+    :param threshold: sessions with any stream below this confidence are flagged for review
+    :param drift_threshold: RMS residual, in seconds, of the drift fit above which the shift warning is set
+    :param missing_threshold: percentage of missing samples in any stream above which the data missing warning is set
+    :return: dictionary of session name: result. Sessions whose files failed to load hold an 'error' entry instead
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(align_session, session, base_dir, search_window, threshold, drift_threshold,
+                        missing_threshold): session['name']
+            for session in sessions
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as err:
+                results[name] = {'error': f'{type(err).__name__}: {err}', 'needs_review': True}
+            print(f"{name}: {'needs review' if results[name]['needs_review'] else 'ok'}")
+    return results
+
+
+def save_results(results, file_path):
+    """Write batch results to JSON, with Timedelta offsets stored as strings"""
+    def encode(value):
+        if isinstance(value, pd.Timedelta):
+            return str(value)
+        raise TypeError(f'Cannot serialize {type(value)}')
+
+    with open(file_path, 'w') as fh:
+        json.dump(results, fh, indent=2, default=encode)
+
+
+def load_results(file_path):
+    """Read batch results written by save_results, restoring the offsets to pd.Timedelta (None where there was none)"""
+    with open(file_path) as fh:
+        results = json.load(fh)
+    for result in results.values():
+        for name, value in result.get('alignments', {}).items():
+            if name not in ('warnings', 'comment', 'drift') and value is not None:
+                result['alignments'][name] = pd.Timedelta(value)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='JSON manifest listing the sessions to align')
+    parser.add_argument('-o', '--output', default='alignments.json', help='file to write the alignments to')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='confidence below which a session needs manual review')
+    parser.add_argument('--drift-threshold', type=float, default=DRIFT_RESIDUAL_THRESHOLD,
+                        help='RMS residual of the clock drift fit, in seconds, above which the shift warning is set')
+    parser.add_argument('--missing-threshold', type=float, default=MISSING_THRESHOLD,
+                        help='percentage of missing samples in any stream above which the data missing warning is set')
+    parser.add_argument('--search-window', type=float, nargs=2, metavar=('MIN', 'MAX'), default=None,
+                        help='only consider offsets between MIN and MAX seconds')
+    parser.add_argument('--review', action='store_true',
+                        help='open the alignment GUI for every session that needs review once the batch is done')
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as fh:
+        sessions = json.load(fh)
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+
+    results = run_batch(sessions, base_dir, args.workers, args.search_window, args.threshold, args.drift_threshold,
+                        args.missing_threshold)
+    save_results(results, args.output)
+
+    to_review = [s for s in sessions if results[s['name']]['needs_review']]
+    print(f'{len(sessions) - len(to_review)} of {len(sessions)} sessions aligned automatically')
+    if args.review:
+        for session in to_review:
+            if 'error' in results[session['name']]:
+                print(f"Skipping {session['name']}, it could not be loaded: {results[session['name']]['error']}")
+                continue
+            print(f"Reviewing {session['name']}")
+            results[session['name']] = review_session(session, base_dir)
+            save_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'aligner')
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+
+class CSVCache(object):
+    """
+    On-disk cache of parsed csv files
+
+    Each cached file is stored as a directory holding one .npy file per column (plus one for the index), so entries can
+    be memory-mapped back in without any parsing. Entries are keyed by the absolute path of the source file, the
+    parameters it was loaded with and either its size and modification time or a hash of its contents. Once the cache
+    grows beyond max_bytes the least recently used entries are deleted.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, validate='stat', mmap=True):
+        """
+        :param cache_dir: directory to keep the cache in. Defaults to $ALIGNER_CACHE_DIR, or ~/.cache/aligner
+        :param max_bytes: size the cache is trimmed back to after every write
+        :param validate: 'stat' to detect changed files by size and modification time, or 'hash' to hash the full
+            contents of the file on every load (slower, but robust to files rewritten with the same size and mtime)
+        :param mmap: memory-map the cached columns rather than reading them into memory
+        """
+        if validate not in ('stat', 'hash'):
+            raise ValueError(f"validate must be 'stat' or 'hash', not {validate!r}")
+        self.cache_dir = cache_dir or os.environ.get('ALIGNER_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.validate = validate
+        self.mmap = mmap
+
+    def key(self, file_path, **params):
+        """Build the cache key of a source file loaded with the given parameters"""
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        if self.validate == 'hash':
+            digest = hashlib.blake2b()
+            with open(file_path, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(2 ** 22), b''):
+                    digest.update(chunk)
+            version = digest.hexdigest()
+        else:
+            version = f'{stat.st_size}-{stat.st_mtime_ns}'
+        description = json.dumps([file_path, version, sorted(params.items())], default=str)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Load a cached DataFrame
+
+        :param key: cache key of the source file and the parameters it was loaded with, see key()
+        :return: the DataFrame, or None if the file (with these parameters) is not in the cache
+        """
+        entry = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as fh:
+                meta = json.load(fh)
+            mmap_mode = 'r' if self.mmap else None
+            index = np.load(os.path.join(entry, 'index.npy'), mmap_mode=mmap_mode)
+            columns = {
+                name: np.load(os.path.join(entry, f'{i}.npy'), mmap_mode=mmap_mode)
+                for i, name in enumerate(meta['columns'])
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Mark as recently used for the eviction policy
+        os.utime(entry)
+        return pd.DataFrame(columns, index=pd.Index(index, name=meta['index_name']), copy=False)
+
+    def put(self, key, df):
+        """
+        Store a parsed DataFrame in the cache. Frames with non-numeric columns are not cached
+
+        :param key: cache key of the source file df was parsed from and the parameters it was loaded with, see key().
+            Computed before parsing, so that a file changing while it is parsed is not cached under its new version
+        :param df: the parsed DataFrame
+        """
+        arrays = [np.asarray(df[col]) for col in df.columns]
+        if any(a.dtype == object for a in arrays) or np.asarray(df.index).dtype == object:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = self.entry_dir(key)
+        staging = tempfile.mkdtemp(dir=self.cache_dir, prefix='.staging-')
+        try:
+            np.save(os.path.join(staging, 'index.npy'), np.asarray(df.index))
+            for i, array in enumerate(arrays):
+                np.save(os.path.join(staging, f'{i}.npy'), array)
+            with open(os.path.join(staging, 'meta.json'), 'w') as fh:
+                json.dump({'columns': list(df.columns), 'index_name': df.index.name}, fh)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(staging, entry)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        self.evict()
+
+    def entries(self):
+        """List the (last used time, size in bytes, path) of every entry in the cache"""
+        found = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return found
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(path))
+            found.append((os.stat(path).st_mtime, size, path))
+        return found
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
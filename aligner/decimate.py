@@ -0,0 +1,119 @@
+import numpy as np
+
+from aligner.utils import time_window_bounds
+
+
+def reduce_extrema(times, values, factor, arg_func, fill):
+    """Merge every `factor` consecutive buckets into one, keeping the extreme value and its time"""
+    n_buckets = -(-len(values) // factor)
+    pad = n_buckets * factor - len(values)
+    values = np.concatenate([values, np.full(pad, fill)]).reshape(n_buckets, factor)
+    times = np.concatenate([times, np.full(pad, times[-1])]).reshape(n_buckets, factor)
+    idx = arg_func(values, axis=1)
+    rows = np.arange(n_buckets)
+    return times[rows, idx], values[rows, idx]
+
+
+def interleave_extrema(lo_t, lo, hi_t, hi):
+    """Combine the per-bucket min and max into one time-ordered line, two points per bucket"""
+    lo_first = lo_t <= hi_t
+    time = np.empty((len(lo), 2))
+    values = np.empty((len(lo), 2))
+    time[:, 0] = np.where(lo_first, lo_t, hi_t)
+    time[:, 1] = np.where(lo_first, hi_t, lo_t)
+    values[:, 0] = np.where(lo_first, lo, hi)
+    values[:, 1] = np.where(lo_first, hi, lo)
+    values[np.isinf(values)] = np.nan
+    return time.ravel(), values.ravel()
+
+
+class MinMaxPyramid(object):
+    """
+    Multi-level min/max decimation of a single time series
+
+    Level 0 is the raw data. Each following level groups the previous level into buckets of `factor` samples and keeps
+    only the minimum and the maximum of each bucket (in the order they occurred), so the envelope of the signal, and
+    therefore any sharp gesture artifact, survives at every level. Every level is kept as a pair of sorted time/value
+    arrays so that a time window can be cut out of any level by binary search.
+    """
+
+    def __init__(self, time, values, factor=4, min_points=2000):
+        """
+        :param time: sorted 1-D array of sample times
+        :param values: 1-D array of sample values, same length as time
+        :param factor: number of buckets of one level that are merged into a single bucket of the next level
+        :param min_points: stop adding levels once a level would hold fewer than this many points
+        """
+        self.factor = int(factor)
+        self.bucket_sizes = [1]
+        self.levels = [(np.asarray(time, dtype=float), np.asarray(values, dtype=float))]
+
+        # Running per-bucket extrema, used to build each level from the one below it in O(N) total
+        lo_t = hi_t = self.levels[0][0]
+        lo = np.where(np.isnan(self.levels[0][1]), np.inf, self.levels[0][1])
+        hi = np.where(np.isnan(self.levels[0][1]), -np.inf, self.levels[0][1])
+
+        while 2 * len(lo) / self.factor >= min_points:
+            lo_t, lo = reduce_extrema(lo_t, lo, self.factor, np.argmin, np.inf)
+            hi_t, hi = reduce_extrema(hi_t, hi, self.factor, np.argmax, -np.inf)
+            self.bucket_sizes.append(self.bucket_sizes[-1] * self.factor)
+            self.levels.append(interleave_extrema(lo_t, lo, hi_t, hi))
+
+        self.value_range = self.envelope_range(self.levels[-1][1])
+
+    @classmethod
+    def from_levels(cls, levels, factor=4, value_range=None):
+        """
+        Wrap levels that were already built, e.g. memory-mapped from disk by aligner.outofcore
+
+        :param levels: list of (time, values) array pairs, from the raw data to the coarsest level
+        :param factor: the factor the levels were built with
+        :param value_range: (min, max) of the data. Computed from the coarsest level if not given
+        """
+        pyramid = cls.__new__(cls)
+        pyramid.factor = int(factor)
+        pyramid.bucket_sizes = [pyramid.factor ** i for i in range(len(levels))]
+        pyramid.levels = list(levels)
+        pyramid.value_range = cls.envelope_range(levels[-1][1]) if value_range is None else tuple(value_range)
+        return pyramid
+
+    @staticmethod
+    def envelope_range(top):
+        """The coarsest level keeps the envelope of the whole stream, so its extremes are the extremes of the data"""
+        return (np.nanmin(top), np.nanmax(top)) if np.isfinite(top).any() else (np.nan, np.nan)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def pick_level(self, t_start, t_end, n_pixels):
+        """
+        Choose the coarsest level that still gives at least one min/max pair per horizontal pixel in the window
+
+        :param t_start: start of the visible time window
+        :param t_end: end of the visible time window
+        :param n_pixels: width of the plotting area, in pixels
+        :return: index of the level to draw
+        """
+        i0, i1 = time_window_bounds(self.levels[0][0], t_start, t_end)
+        n_raw = i1 - i0
+        bucket_size = n_raw / max(n_pixels, 1)
+        level = int(np.searchsorted(self.bucket_sizes, bucket_size, side='right')) - 1
+        return min(max(level, 0), len(self.levels) - 1)
+
+    def window(self, t_start, t_end, n_pixels, margin=0.0):
+        """
+        Get the decimated samples covering a time window, sized to the number of available pixels
+
+        One sample on either side of the window is included so that the drawn line reaches the edges of the plot.
+
+        :param t_start: start of the visible time window
+        :param t_end: end of the visible time window
+        :param n_pixels: width of the plotting area, in pixels
+        :param margin: extra time to include on both sides of the window, at the same level of decimation
+        :return: tuple of (time, values, level) where time and values are views into the chosen level
+        """
+        level = self.pick_level(t_start, t_end, n_pixels)
+        time, values = self.levels[level]
+        i0, i1 = time_window_bounds(time, t_start - margin, t_end + margin)
+        i0 = max(i0 - 1, 0)
+        return time[i0:i1 + 1], values[i0:i1 + 1], level
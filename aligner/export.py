@@ -0,0 +1,333 @@
+"""
+Streaming export of an aligned session into a single dataset
+
+Every stream of a session is shifted by its accepted offset and joined onto a common clock: either the timestamps of
+the true time stream, or a regular grid at a given sample rate. All the files are read in chunks, side by side, and
+every chunk of the clock is written out as soon as it is joined, so memory use depends on the chunk size only, not on
+the length of the recordings.
+
+The result has a 'time' column followed by one column per data column of every stream, named <stream>_<column> (or a
+single <stream> column holding the L2 norm, with norm=True). Samples further than the tolerance from every clock tick
+(e.g. in a dropout, or before a stream starts) are left empty. Parquet output stores time as a timestamp and needs
+pyarrow. Csv output stores it as integer epoch nanoseconds, so it can be read back exactly with
+load_csv(path, time_scale_to_seconds=1e9).
+
+Usage:
+    python -m aligner.export manifest.json alignments.json -o aligned [--format parquet] [--sample-rate 100]
+"""
+import argparse
+import json
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from aligner.gaps import gap_index
+from aligner.utils import col_names, epoch_to_datetime, norm_df, source_spec
+
+DEFAULT_CHUNK_SIZE = 2 ** 18
+METHODS = ('nearest', 'linear')
+
+
+class StreamCursor(object):
+    """
+    Reads one csv file in chunks, on the aligned clock, buffering only the samples around the current clock chunk
+    """
+
+    def __init__(self, name, file_path, time_scale_to_seconds=1.0, columns=None, offset=0.0, tolerance=None,
+                 norm=False, dtype=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        :param name: name of the stream, used to name its columns
+        :param file_path: path to the csv file, with timestamps in the first column
+        :param time_scale_to_seconds: number of timestamp units in one second
+        :param columns: names of the data columns to export. By default every column not including 'time'
+        :param offset: offset of the stream, in seconds, as returned by manual_align
+        :param tolerance: furthest a sample can be from a clock tick and still be joined to it, in seconds. Defaults to
+            the nominal sample interval of the stream, measured on its first chunk
+        :param norm: export the L2 norm of the columns instead of the columns themselves
+        :param dtype: dtype to export the values as. Defaults to float64
+        :param chunk_size: number of csv rows read at once
+        """
+        self.name = name
+        self.time_scale_to_seconds = time_scale_to_seconds
+        self.columns = None if columns is None else list(columns)
+        self.offset_ns = int(round(offset * 1e9))
+        self.tolerance_ns = None if tolerance is None else int(round(tolerance * 1e9))
+        self.norm = norm
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
+        self.reader = pd.read_csv(file_path, header=0, index_col=0, chunksize=chunk_size)
+        self.exhausted = False
+        # Chunks of (time, values) read but not yet released, oldest first. Only joined into one array per clock chunk
+        self.chunks = deque()
+        self.keep_from = None
+        self.max_buffered = 0
+
+    @property
+    def output_names(self):
+        if self.norm:
+            return [self.name]
+        return [f'{self.name}_{col}' for col in self.columns]
+
+    @property
+    def time(self):
+        """Sample times of the buffered samples, in epoch nanoseconds"""
+        if not self.chunks:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([time for time, _ in self.chunks])
+
+    @property
+    def values(self):
+        return np.concatenate([values for _, values in self.chunks])
+
+    @property
+    def buffered(self):
+        """Number of samples currently buffered"""
+        return sum(len(time) for time, _ in self.chunks)
+
+    def read(self):
+        """
+        Append the next chunk of the file to the buffer, dropping the samples no longer needed, see release()
+
+        :return: False once the whole file has been read
+        """
+        try:
+            chunk = next(self.reader)
+        except StopIteration:
+            self.exhausted = True
+            self.tolerance_ns = 0 if self.tolerance_ns is None else self.tolerance_ns
+            return False
+        if self.columns is None:
+            self.columns = col_names(chunk, exclude='time')
+        time = epoch_to_datetime(chunk.index, self.time_scale_to_seconds).asi8 + self.offset_ns
+        if self.norm:
+            values = norm_df(chunk, column_names=self.columns, dtype=self.dtype).to_numpy()
+        else:
+            values = chunk[self.columns].to_numpy(dtype=self.dtype)
+
+        if self.tolerance_ns is None:
+            self.tolerance_ns = int(round(gap_index(time / 1e9).interval * 1e9)) if len(time) > 1 else 0
+        if len(time):
+            self.chunks.append((time, values))
+        self.trim()
+        self.max_buffered = max(self.max_buffered, self.buffered)
+        return True
+
+    def ensure(self, t_start, t_end):
+        """
+        Read until the buffer holds every sample within the tolerance of the clock ticks from t_start to t_end, or the
+        file ends. Samples before that are dropped as the chunks come in, so a stream that starts long before the clock
+        is never held in memory whole
+        """
+        self.release(t_start - (self.tolerance_ns or 0))
+        while not self.exhausted and (not self.chunks or self.chunks[-1][0][-1] < t_end + self.tolerance_ns):
+            self.read()
+            self.release(t_start - self.tolerance_ns)
+
+    def release(self, t_ns):
+        """Drop the buffered samples before t_ns, except the last one, which a later clock tick may still be nearest"""
+        self.keep_from = t_ns if self.keep_from is None else max(self.keep_from, t_ns)
+        self.trim()
+
+    def trim(self):
+        """Drop the samples before keep_from, except the last one of them"""
+        if self.keep_from is None:
+            return
+        # Whole chunks first, as long as the next one still starts before keep_from
+        while len(self.chunks) > 1 and self.chunks[1][0][0] < self.keep_from:
+            self.chunks.popleft()
+        if self.chunks:
+            time, values = self.chunks[0]
+            keep = max(int(np.searchsorted(time, self.keep_from, side='left')) - 1, 0)
+            if keep:
+                self.chunks[0] = (time[keep:], values[keep:])
+
+    def join(self, clock, method='nearest'):
+        """
+        Join the buffered samples onto clock ticks
+
+        :param clock: sorted int64 array of clock ticks, in epoch nanoseconds
+        :param method: 'nearest' to take the nearest sample, or 'linear' to interpolate between the samples on
+            either side
+        :return: 2-D array with a row per clock tick and a column per output column. NaN where no sample is within
+            the tolerance
+        """
+        out = np.full((len(clock), len(self.output_names)), np.nan, dtype=self.dtype)
+        if not self.chunks:
+            return out
+        time, values = self.time, self.values
+        right = np.searchsorted(time, clock, side='left')
+        left = np.clip(right - 1, 0, len(time) - 1)
+        right = np.clip(right, 0, len(time) - 1)
+        to_right = np.abs(time[right] - clock) < np.abs(clock - time[left])
+        nearest = np.where(to_right, right, left)
+        close = np.abs(time[nearest] - clock) <= self.tolerance_ns
+
+        if method == 'nearest':
+            out[close] = values[nearest[close]]
+        else:
+            # Relative to the first tick, so that nanosecond epochs keep their precision as floats
+            x, xp = (clock - clock[0]).astype(np.float64), (time - clock[0]).astype(np.float64)
+            for i in range(out.shape[1]):
+                out[close, i] = np.interp(x[close], xp, values[:, i])
+        return out
+
+
+def export_aligned(sources, alignments, out_path, true_time=None, sample_rate=None, method='nearest', tolerance=None,
+                   norm=False, dtype=None, file_format=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Write every stream of a session, shifted by its alignment, into one dataset on a common clock
+
+        export_aligned({
+            'watch': ('watch_accel.csv', 1),
+            'rcs_left': ('rcs_left_accel.csv', 1000),
+            'rcs_right': ('rcs_right_accel.csv', 1000),
+        }, manual_align(watch, **streams), 'aligned.parquet')
+
+    :param sources: dictionary of name: (path, time_scale_to_seconds, columns), as for load_session. The true time
+        stream must be included
+    :param alignments: dictionary of alignments as returned by manual_align. Streams missing from it are not shifted
+    :param out_path: file to write. Its extension picks the format unless file_format is given
+    :param true_time: name of the true time stream in sources. Defaults to the first one
+    :param sample_rate: rate, in Hz, of a regular clock grid starting at the first true time sample. By default the
+        timestamps of the true time stream are the clock
+    :param method: 'nearest' to take the nearest sample of every stream at each tick, or 'linear' to interpolate
+    :param tolerance: furthest a sample can be from a tick and still be used, in seconds. Defaults to the nominal sample
+        interval of each stream
+    :param norm: export the L2 norm of each stream's columns instead of the columns themselves
+    :param dtype: dtype to export the values as, e.g. np.float32 to halve the size. Defaults to float64
+    :param file_format: 'parquet' or 'csv'. Defaults to parquet for .parquet and .pq files and csv otherwise
+    :param chunk_size: number of rows read from the true time file, and so clock ticks written, at once. Other files
+        are read in chunks of the same number of rows, as many as are needed to cover the clock chunk
+    :return: number of rows written
+    """
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {METHODS}, not {method!r}')
+    if file_format is None:
+        file_format = 'parquet' if os.path.splitext(out_path)[1].lower() in ('.parquet', '.pq') else 'csv'
+    true_time = next(iter(sources)) if true_time is None else true_time
+
+    cursors = {}
+    for name, spec in sources.items():
+        path, scale, columns = source_spec(spec)
+        offset = alignments.get(name, 0.0)
+        offset = offset.total_seconds() if isinstance(offset, pd.Timedelta) else float(offset)
+        cursors[name] = StreamCursor(name, path, scale, columns, offset, tolerance, norm, dtype, chunk_size)
+    ref = cursors[true_time]
+    names = None
+
+    sink = ParquetSink(out_path) if file_format == 'parquet' else CSVSink(out_path)
+    rows, last_tick, origin, next_tick = 0, None, None, 0
+    try:
+        while True:
+            more = ref.read()
+            ref_time = ref.time
+            if not len(ref_time):
+                break
+            # Clock ticks up to the last true time sample read so far, that haven't been written yet
+            if sample_rate is None:
+                clock = ref_time if last_tick is None else ref_time[ref_time > last_tick]
+            else:
+                origin = ref_time[0] if origin is None else origin
+                end_tick = int((ref_time[-1] - origin) * sample_rate // 1e9) + 1
+                clock = origin + np.round(np.arange(next_tick, end_tick) * 1e9 / sample_rate).astype(np.int64)
+                next_tick = end_tick
+            if not len(clock):
+                if not more:
+                    break
+                continue
+
+            joined = []
+            for cursor in cursors.values():
+                cursor.ensure(clock[0], clock[-1])
+                joined.append(cursor.join(clock, method))
+                cursor.release(clock[-1] - cursor.tolerance_ns)
+            if names is None:
+                names = [col for cursor in cursors.values() for col in cursor.output_names]
+            sink.write(clock, np.concatenate(joined, axis=1), names)
+            rows += len(clock)
+            last_tick = clock[-1]
+    finally:
+        sink.close()
+    return rows
+
+
+class CSVSink(object):
+    """Appends joined chunks to a csv file, with time as integer epoch nanoseconds"""
+
+    def __init__(self, out_path):
+        self.out_path = out_path
+        self.header = True
+
+    def write(self, clock, values, names):
+        frame = pd.DataFrame(values, columns=names, index=pd.Index(clock, name='time'))
+        frame.to_csv(self.out_path, mode='w' if self.header else 'a', header=self.header)
+        self.header = False
+
+    def close(self):
+        pass
+
+
+class ParquetSink(object):
+    """Appends joined chunks to a parquet file, one row group per chunk"""
+
+    def __init__(self, out_path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as err:
+            raise ImportError('Writing parquet files needs pyarrow (pip install pyarrow), or export to csv') from err
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.out_path = out_path
+        self.writer = None
+
+    def write(self, clock, values, names):
+        arrays = [self.pa.array(clock.view('datetime64[ns]'))]
+        arrays += [self.pa.array(values[:, i]) for i in range(len(names))]
+        table = self.pa.Table.from_arrays(arrays, names=['time'] + names)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.out_path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def main(argv=None):
+    from aligner.batch import file_spec, load_results
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='JSON manifest listing the sessions that were aligned')
+    parser.add_argument('results', help='alignments file written by python -m aligner.batch')
+    parser.add_argument('-o', '--output', default='aligned', help='directory to write one file per session to')
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='csv', help='file format to write')
+    parser.add_argument('--sample-rate', type=float, default=None,
+                        help='resample onto a regular grid at this rate, in Hz, instead of the true time timestamps')
+    parser.add_argument('--method', choices=METHODS, default='nearest', help='how samples are joined onto the clock')
+    parser.add_argument('--norm', action='store_true', help='export the norm of every stream instead of its columns')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows processed at once')
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as fh:
+        sessions = json.load(fh)
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+    results = load_results(args.results)
+    os.makedirs(args.output, exist_ok=True)
+
+    for session in sessions:
+        result = results.get(session['name'], {})
+        if 'alignments' not in result:
+            print(f"Skipping {session['name']}: {result.get('error', 'not aligned')}")
+            continue
+        sources = {'true_time': file_spec(session['true_time'], base_dir)}
+        sources.update({name: file_spec(spec, base_dir) for name, spec in session['streams'].items()})
+        out_path = os.path.join(args.output, f"{session['name']}.{args.format}")
+        rows = export_aligned(sources, result['alignments'], out_path, sample_rate=args.sample_rate,
+                              method=args.method, norm=args.norm, file_format=args.format, chunk_size=args.chunk_size)
+        print(f"{session['name']}: {rows} rows written to {out_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import numpy as np
+
+GAP_FACTOR = 2.0
+MISSING_THRESHOLD = 5.0
+DEFAULT_CHUNK_SIZE = 2 ** 22
+
+
+class GapIndex(object):
+    """
+    Sampling metadata of a time series: its nominal sample interval, where samples are missing and how many
+
+    A gap is any step between consecutive samples longer than gap_factor times the nominal interval, e.g. a Bluetooth
+    dropout. Use gap_index() to build one.
+    """
+
+    __slots__ = ('interval', 'gaps', 'missing', 'count')
+
+    def __init__(self, interval, gaps, missing, count):
+        """
+        :param interval: nominal sample interval, in seconds. The median step between consecutive samples
+        :param gaps: (n, 2) array of the (start, end) times of every gap, i.e. of the samples on either side of it
+        :param missing: number of samples missing at the nominal interval, over the whole time series
+        :param count: number of samples present
+        """
+        self.interval = interval
+        self.gaps = gaps
+        self.missing = missing
+        self.count = count
+
+    @property
+    def percent_missing(self):
+        """Share of the samples expected at the nominal interval that are missing, in percent"""
+        expected = self.count + self.missing
+        return 100.0 * self.missing / expected if expected else 0.0
+
+    def __len__(self):
+        return len(self.gaps)
+
+    def to_meta(self):
+        """JSON-serializable dictionary of the index, see from_meta()"""
+        return {'interval': self.interval, 'gaps': self.gaps.tolist(), 'missing': self.missing, 'count': self.count}
+
+    @classmethod
+    def from_meta(cls, meta):
+        """Rebuild an index stored with to_meta()"""
+        return cls(meta['interval'], np.asarray(meta['gaps'], dtype=np.float64).reshape(-1, 2), meta['missing'],
+                   meta['count'])
+
+    def longer_than(self, duration):
+        """(start, end) times of the gaps at least duration seconds long"""
+        return self.gaps[self.gaps[:, 1] - self.gaps[:, 0] >= duration]
+
+
+def gap_index(time, gap_factor=GAP_FACTOR, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Find the nominal sample interval and every gap of a time series
+
+    Arrays of up to chunk_size samples are handled with a single np.diff. Longer ones (typically memory-mapped) are
+    read chunk_size samples at a time, taking the nominal interval as the median of the per-chunk medians.
+
+    :param time: sorted 1-D array of sample times, in seconds
+    :param gap_factor: steps longer than this many nominal intervals are gaps
+    :param chunk_size: largest number of samples read at once
+    :return: GapIndex of the time series
+    """
+    if len(time) < 2:
+        return GapIndex(np.nan, np.empty((0, 2)), 0, len(time))
+
+    if len(time) <= chunk_size:
+        steps = np.diff(time)
+        interval = float(np.median(steps))
+        gaps = _find_gaps(time, steps, gap_factor * interval)
+    else:
+        # Consecutive chunks overlap by one sample, so that the step between them is not lost
+        bounds = range(0, len(time) - 1, chunk_size)
+        interval = float(np.median([np.median(np.diff(time[i:i + chunk_size + 1])) for i in bounds]))
+        gaps = np.concatenate([
+            _find_gaps(time[i:i + chunk_size + 1], np.diff(time[i:i + chunk_size + 1]), gap_factor * interval)
+            for i in bounds
+        ])
+
+    # Counted over the whole recording rather than summed over the gaps, so that samples delivered in bursts after a
+    # dropout (with timestamps closer together than the nominal interval) make up for it
+    if interval > 0:
+        missing = max(int(round((time[-1] - time[0]) / interval)) + 1 - len(time), 0)
+    else:
+        missing = 0
+    return GapIndex(interval, gaps, missing, len(time))
+
+
+def _find_gaps(time, steps, threshold):
+    """(start, end) times of the steps longer than the threshold"""
+    idx = np.flatnonzero(steps > threshold)
+    return np.column_stack([time[idx], time[idx + 1]]).astype(np.float64)
+
+
+def break_gaps(time, values, gaps):
+    """
+    Insert a NaN value into a line wherever it crosses a gap, so it is drawn with a break instead of a straight segment
+
+    :param time: sorted 1-D array of sample times, e.g. a window of one level of a decimation pyramid
+    :param values: 1-D array of sample values, same length as time
+    :param gaps: (n, 2) array of the (start, end) times of the gaps to break the line at
+    :return: tuple of (time, values). The inputs themselves if no gap falls inside them, otherwise new arrays
+    """
+    if not len(gaps) or len(time) < 2:
+        return time, values
+    # Index of the first sample after every gap, for the gaps with samples on both sides
+    idx = np.unique(np.searchsorted(time, gaps[:, 1], side='left'))
+    idx = idx[(idx > 0) & (idx < len(time))]
+    if not len(idx):
+        return time, values
+    return np.insert(time, idx, time[idx]), np.insert(np.asarray(values, dtype=np.float64), idx, np.nan)
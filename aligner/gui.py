@@ -1,15 +1,20 @@
 import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 import numpy as np
 import pandas as pd
 from tkinter import simpledialog
-from matplotlib import pyplot as plt
-from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, NavigationToolbar2Tk)
 from aligner.utils import timestamp_to_elapsed
+from aligner.stream import LazyStreams, Stream
+from aligner.outofcore import OnDiskRecording
+from aligner.perf import PerfRecorder, timed
+from aligner.auto_align import DRIFT_RESIDUAL_THRESHOLD, DRIFT_WARNING, estimate_drift, estimate_lag
+from aligner.gaps import MISSING_THRESHOLD, break_gaps
 
 
-def manual_align(true_time_data, scale=None, **data_to_align):
+def manual_align(true_time_data, scale=None, auto_align=None, drift=None, drift_threshold=DRIFT_RESIDUAL_THRESHOLD,
+                 missing_threshold=MISSING_THRESHOLD, perf_trace=None, **data_to_align):
     """
     Wrapper function to easily pass data into the AlignGUI
 
@@ -20,11 +25,28 @@ def manual_align(true_time_data, scale=None, **data_to_align):
     :param true_time_data: DataFrame containing data assumed to be 'correct' time
     :param scale: default scale factor to apply to the data relative to the true time data. If left none, then the
         time series will be zscore-scaled
+    :param auto_align: start each time series at the offset suggested by cross-correlation, rather than at 0.0.
+        Defaults to True, unless any of the data is an OnDiskRecording, since the cross-correlation reads every sample
+    :param drift: estimate the clock drift of each time series once its alignment is accepted. Defaults to True, unless
+        any of the data is an OnDiskRecording, for the same reason
+    :param drift_threshold: RMS residual, in seconds, of the drift fit above which the shift warning is set
+        automatically
+    :param missing_threshold: percentage of missing samples in any time series above which the data missing warning is
+        set automatically. None to never set it
+    :param perf_trace: path to write a JSON trace of the timing of every redraw to when the window closes, see
+        PerfRecorder. None to not record one
     :param data_to_align: keyword arguments, each containing a DataFrame with the data to be time-aligned
 
-    :return: Dictionary containing the alignments as well as any comments and warning flags
+    :return: Dictionary containing the alignments as well as any comments and warning flags. If drift is on, it also
+        holds a 'drift' dictionary with the drift rate of every time series in seconds per second (None where it
+        couldn't be estimated)
     """
-    aligner = AlignGUI(true_time_data, data_to_align)
+    out_of_core = any(isinstance(data, OnDiskRecording) for data in [true_time_data, *data_to_align.values()])
+    auto_align = not out_of_core if auto_align is None else auto_align
+    drift = not out_of_core if drift is None else drift
+
+    aligner = AlignGUI(true_time_data, data_to_align, auto_align=auto_align, drift=drift,
+                       missing_threshold=missing_threshold, perf_trace=perf_trace)
     aligner.next()
 
     if scale is None:
@@ -36,11 +58,18 @@ def manual_align(true_time_data, scale=None, **data_to_align):
     alignments = {}
     for name, align in aligner.complete_alignments.items():
         alignments[name] = pd.Timedelta(seconds=align)
+    estimates = aligner.drift_results()
+    if drift:
+        alignments['drift'] = {name: None if est is None else est['drift'] for name, est in estimates.items()}
+    drifting = [name for name, est in estimates.items() if est is not None and est['residual'] > drift_threshold]
+
     warnings = {}
     if aligner.gen_warning_flag.get():
         warnings['general warning'] = 'Aligner was generally concerned with the quality of the alignment'
     if aligner.align_shift_flag.get():
         warnings['shift warning'] = 'Suspected data shift, alignments do not match across recording'
+    elif drifting:
+        warnings['shift warning'] = f"{DRIFT_WARNING}: {', '.join(drifting)}"
     if aligner.data_missing_flag.get():
         warnings['data missing warning'] = 'Enough data was missing that this alignment is uncertain'
     alignments['warnings'] = warnings
@@ -50,7 +79,8 @@ def manual_align(true_time_data, scale=None, **data_to_align):
 
 class AlignGUI(object):
 
-    def __init__(self, true_time_source=None, align_sources=None):
+    def __init__(self, true_time_source=None, align_sources=None, blit=True, auto_align=False, perf_trace=None,
+                 drift=False, missing_threshold=None):
 
         self.true_time_data = None
         self.data_to_align = None
@@ -62,12 +92,33 @@ class AlignGUI(object):
         self.down_sample_range = None
 
         self.window = None
+        self.perf = PerfRecorder(enabled=perf_trace is not None, keep_trace=perf_trace is not None)
+        self.perf_trace = perf_trace
+        self.blit = blit
+        self.background = None
+        self.auto_align = auto_align
+        self.suggestions = {}
+        self.zscore_scales = {}
+        self.prefetcher = ThreadPoolExecutor(max_workers=1)
+        self.prefetched = {}
+        self.drift = drift
+        self.drift_estimates = {}
+        self.missing_threshold = missing_threshold
+        self.missing_checked = set()
+
+        # Navigation requested by key presses that haven't been drawn yet, see flush_pending()
+        self.coalesce_keys = False
+        self.pending_window = None
+        self.pending_shift = 0.0
+        self.flush_id = None
+        self.onset_index = None
+        self.onset_candidates = None
 
         self.init_window()
 
         # Tk Variables that need to be kept track of
         self.status = tk.StringVar(master=self.window, value='Initializing...')
-        self.down_sample_current = tk.IntVar(master=self.window, value=10)
+        self.down_sample_current = tk.IntVar(master=self.window, value=0)
         self.t_window_start = tk.DoubleVar(master=self.window, value=0.0)
         self.t_window_end = tk.DoubleVar(master=self.window, value=0.0)
         self.t_center = tk.StringVar(master=self.window, value='')
@@ -81,11 +132,10 @@ class AlignGUI(object):
         self.look_factor = tk.DoubleVar(master=self.window, value=4.0)
         self.shift_factor = tk.DoubleVar(master=self.window, value=30.0)
         self.scale_factor = tk.DoubleVar(master=self.window, value=1.1)
+        self.onset_view_width = tk.DoubleVar(master=self.window, value=60.0)
         self.current_scale = tk.DoubleVar(master=self.window, value=1)
         self.plot_axis = tk.StringVar(master=self.window, value='norm')
 
-        self.prep_data(true_time_source, align_sources)
-
         # Tk window elements that need to be kept track of
         self.status_label = None
         self.graphing_frame = None
@@ -94,12 +144,20 @@ class AlignGUI(object):
         self.pose_frame_plots = None
         self.timeseries_canvas = None
         self.timeseries_figure = None
+        self.overview_canvas = None
+        self.overview_figure = None
+        self.overview_background = None
+        self.overview_window = None
+        self.overview_grab = None
         self.ground_truth_ts = None
         self.aligning_ts = None
         self.centerline = None
         self.other_ts = []
+        self.line_sources = {}
 
+        # Show the window straight away, then prepare the data with progress shown in the status area
         self.init_layout()
+        self.prep_data(true_time_source, align_sources)
 
         self.begin_alignment()
         self.bind_keys()
@@ -109,6 +167,10 @@ class AlignGUI(object):
         return self.window.winfo_height(), self.window.winfo_width()
 
     def bind_keys(self):
+        # Held navigation keys auto-repeat faster than the plot can be drawn. Accumulate their effect and draw it once
+        # the event queue is empty instead of drawing after every single event
+        self.coalesce_keys = True
+
         self.window.bind('z', self.zoom_in)
         self.window.bind('x', self.zoom_out)
         self.window.bind('s', self.shift_warn)
@@ -117,7 +179,11 @@ class AlignGUI(object):
         self.window.bind('<Up>', self.scale_up)
         self.window.bind('<Down>', self.scale_down)
         self.window.bind('r', self.zscore_rescale)
+        self.window.bind('a', self.align_in_view)
+        self.window.bind('g', self.next_onset)
+        self.window.bind('G', self.prev_onset)
         self.window.bind('c', self.comment)
+        self.window.bind('p', self.toggle_perf_hud)
         self.window.bind('<Left>', self.look_left)
         self.window.bind('<Right>', self.look_right)
         self.window.bind('<Shift-Left>', self.shift_left)
@@ -137,6 +203,7 @@ class AlignGUI(object):
             self.window.state('zoomed')
         self.window.title('Manual Time Alignment')
         self.window.geometry("500x500")
+        self.window.protocol('WM_DELETE_WINDOW', self.close)
         tk.Tk.report_callback_exception = self.show_error
 
     def init_layout(self):
@@ -184,23 +251,45 @@ class AlignGUI(object):
 
     def begin_alignment(self):
         self.currently_aligning.set(self.align_names[0])
+        self.update_status(f'Preparing {self.align_names[0]}...')
+        self.prefetch(self.align_names[0])
+        self.wait_for_view(self.align_names[0])
         self.plot_all_timeseries()
-        self.update_canvas()
+
+        # Index the candidate gestures and prepare everything else in the background, adding the gray lines as the
+        # streams become ready
+        self.onset_candidates = self.prefetcher.submit(lambda: self.true_time_data.onsets)
+        for name in self.align_names[1:]:
+            self.prefetch(name)
+        self.plot_ready_streams()
 
     def destroy_plot(self):
         try:
             self.disposable_graphing.destroy()
         except AttributeError:
             pass
+        self.timeseries_canvas = None
+        self.timeseries_figure = None
+        self.overview_canvas = None
+        self.overview_figure = None
+        self.overview_background = None
 
     def clear_plotting(self):
-        self.destroy_plot()
+        """Remove every plotted artist, keeping the figure and canvas to plot into again"""
+        for artist in list(self.line_sources) + [self.centerline]:
+            try:
+                artist.remove()
+            except (AttributeError, ValueError):
+                pass
+        if self.timeseries_figure is not None and self.timeseries_figure.axes[0].get_legend() is not None:
+            self.timeseries_figure.axes[0].get_legend().remove()
         self.pose_frame_plots = None
-        self.timeseries_canvas = None
-        self.timeseries_figure = None
         self.ground_truth_ts = None
         self.aligning_ts = None
+        self.centerline = None
         self.other_ts = []
+        self.line_sources = {}
+        self.background = None
 
     def close_messasge(self):
         self.destroy_plot()
@@ -220,32 +309,46 @@ class AlignGUI(object):
         self.disposable_graphing.pack()
 
     def reset_plot(self, *args):
-        self.clear_plotting()
-        self.set_data_lims()
         self.plot_all_timeseries()
-        self.t_window_update()
         self.update_status('Ready!')
 
-    def plot_all_timeseries(self):
-
-        self.status.set('Re-plotting all...')
+    def init_figure(self):
+        """Create the figure and canvas that every timeseries gets plotted into"""
         self.destroy_plot()
         self.disposable_graphing = tk.Frame(self.graphing_frame, borderwidth=1)
         self.disposable_graphing.pack()
 
+        self.create_canvases()
+
+    def create_canvases(self):
+        """Create the main timeseries figure and the overview strip under it, each on its own canvas"""
+        self.timeseries_figure = self.build_figure()
+        self.timeseries_canvas = self.new_canvas(self.timeseries_figure)
+        self.timeseries_canvas.mpl_connect('draw_event', self.on_draw)
+
+        self.overview_figure = self.build_overview_figure()
+        self.overview_canvas = self.new_canvas(self.overview_figure)
+        self.overview_canvas.mpl_connect('draw_event', self.on_overview_draw)
+        self.overview_canvas.mpl_connect('button_press_event', self.on_overview_press)
+        self.overview_canvas.mpl_connect('motion_notify_event', self.on_overview_drag)
+        self.overview_canvas.mpl_connect('button_release_event', self.on_overview_release)
+
+    def new_canvas(self, fig):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        canvas = FigureCanvasTkAgg(fig, master=self.disposable_graphing)
+        canvas.get_tk_widget().pack()
+        return canvas
+
+    def build_figure(self):
+        from matplotlib.figure import Figure
+
         h, w = self.window_dims
         h = int(round(3 / 8 * h))
         w = int(round(3 / 4 * w))
-        fig = plt.Figure(figsize=(w / 100, h / 100))
+        fig = Figure(figsize=(w / 100, h / 100))
         ax = fig.add_subplot(1, 1, 1)
-
-        self.plot_true_time_ts(ax)
-        self.plot_other_ts(ax)
-        self.plot_aligning_ts(ax)
-        fig.axes[0].legend()
-        fig.axes[0].set_xlabel('Time Elapsed (s)')
-        self.set_data_lims()
-        self.plot_centerline(ax)
+        ax.set_xlabel('Time Elapsed (s)')
 
         # Shift graph up to ensure all labels are visible
         pos = ax.get_position()
@@ -253,66 +356,273 @@ class AlignGUI(object):
         pos.y0 += offset
         pos.y1 += offset
         ax.set_position(pos)
+        return fig
 
-        canvas = FigureCanvasTkAgg(fig, master=self.disposable_graphing)
-        canvas.draw()
-        canvas.get_tk_widget().pack()
-        self.timeseries_canvas = canvas
-        self.timeseries_figure = fig
-        self.t_window_update()
-        self.update_status('Ready!')
+    def build_overview_figure(self):
+        """Thin strip showing the whole recording, lined up with the x axis of the main figure"""
+        from matplotlib.figure import Figure
 
-    def get_data_range(self, data_src):
-        selection = np.logical_and(
-            self.t_window_start.get() < data_src.index,
-            data_src.index <= self.t_window_end.get()
-        )
-        return data_src[selection]
+        h, w = self.window_dims
+        h = int(round(1 / 12 * h))
+        w = int(round(3 / 4 * w))
+        fig = Figure(figsize=(w / 100, h / 100))
+        ax = fig.add_subplot(1, 1, 1)
+        main_pos = self.timeseries_figure.axes[0].get_position()
+        ax.set_position([main_pos.x0, 0.3, main_pos.width, 0.65])
+        ax.set_yticks([])
+        ax.tick_params(axis='x', labelsize=7)
+        return fig
+
+    @timed
+    def plot_all_timeseries(self):
+
+        self.status.set('Re-plotting all...')
+        self.pending_window, self.pending_shift = None, 0.0
+        if self.timeseries_figure is None:
+            self.init_figure()
+        self.clear_plotting()
+        ax = self.timeseries_figure.axes[0]
+        ax.set_autoscale_on(True)
+
+        self.set_data_lims()
+        self.plot_true_time_ts(ax)
+        self.plot_other_ts(ax)
+        self.plot_aligning_ts(ax)
+        ax.legend()
+        self.plot_centerline(ax)
+        self.plot_overview()
+
+        self.t_window_update(redraw=True)
+        self.update_status('Ready!')
 
     def plot_true_time_ts(self, axes):
-        self.ground_truth_ts = self.plot_ts(self.true_time_data, axes, 'True Time', 'tab:blue')
+        self.ground_truth_ts = self.plot_ts(
+            self.true_time_data.pyramid, axes, 'True Time', 'tab:blue', gaps=self.true_time_data.gaps,
+            t_base=self.true_time_data.offset)
 
     def plot_aligning_ts(self, axes):
+        self.down_sample_range = (0, len(self.aligning_data.pyramid) - 1)
         self.aligning_ts = self.plot_ts(
-            self.aligning_data * self.scale_factor.get(),
-            axes, self.align_names[self.align_index], 'tab:orange')
+            self.aligning_data.pyramid, axes, self.currently_aligning.get(), 'tab:orange',
+            t_offset=self.align_offset.get(), y_scale=self.current_scale.get(), animated=self.blit,
+            gaps=self.aligning_data.gaps, t_base=self.aligning_data.offset)
 
     def plot_other_ts(self, axes):
-        for i, name in enumerate(self.align_names):
-            offset = self.complete_alignments[name] if name in self.complete_alignments else 0.0
-            if i != self.align_index:
-                plotted = self.plot_ts(self.data_to_align[name], axes, name, 'lightgray', t_offset=offset)
-                self.other_ts.append(plotted)
-
-    def plot_ts(self, src_data, axes, label, color, t_offset=0.0):
-        data = self.get_data_range(src_data)
-        time = np.array(data.index) + t_offset
-        values = data[self.plot_axis.get()]
-        return axes.plot(time, values, label=label, alpha=0.5, color=color)[0]
+        for name in self.pending_other_ts():
+            self.plot_other_stream(axes, name)
+
+    def pending_other_ts(self):
+        """Names of the other streams that are ready to be drawn in gray but haven't been yet"""
+        plotted = {line.get_label() for line in self.other_ts}
+        return [
+            name for i, name in enumerate(self.align_names)
+            if i != self.align_index and name not in plotted and self.view_ready(name)
+        ]
+
+    def plot_other_stream(self, axes, name):
+        offset = self.complete_alignments[name] if name in self.complete_alignments else 0.0
+        stream = self.data_to_align[name]
+        plotted = self.plot_ts(
+            stream.pyramid, axes, name, 'lightgray',
+            t_offset=offset, y_scale=self.current_scale.get(), gaps=stream.gaps, t_base=stream.offset)
+        self.other_ts.append(plotted)
+
+    def plot_ready_streams(self):
+        """Add gray lines for streams that finished preparing in the background, until all of them are drawn"""
+        if self.timeseries_figure is not None:
+            pending = self.pending_other_ts()
+            for name in pending:
+                self.plot_other_stream(self.timeseries_figure.axes[0], name)
+            if pending:
+                self.timeseries_figure.axes[0].legend()
+                self.update_canvas()
+        if not all(self.view_ready(name) for name in self.align_names):
+            self.window.after(250, self.plot_ready_streams)
+
+    def plot_ts(self, pyramid, axes, label, color, t_offset=0.0, y_scale=1.0, animated=False, gaps=None, t_base=0.0):
+        """
+        Plot a timeseries as a line re-sliced from its decimation pyramid whenever the time window changes
+
+        :param t_offset: alignment offset of the line, in seconds
+        :param t_base: offset of the pyramid's own sample times from the plot's clock, see Stream.offset
+        """
+        from matplotlib.transforms import Affine2D
+
+        line = axes.plot([], [], label=label, alpha=0.5, color=color, animated=animated)[0]
+        self.line_sources[line] = {
+            'pyramid': pyramid, 't_offset': t_offset, 'y_scale': y_scale, 'transform': Affine2D(), 'extent': None,
+            'gaps': gaps, 't_base': t_base,
+        }
+        line.set_transform(self.line_sources[line]['transform'] + axes.transData)
+        self.update_line_transform(line)
+        self.refresh_line(line, axes.bbox.width)
+        axes.relim()
+        axes.autoscale_view()
+        return line
+
+    def update_line_transform(self, line):
+        """
+        Apply a line's time offset and display scale as an affine transform
+
+        The sample arrays of the line are left untouched, so shifting and rescaling cost the same for any stream length
+        """
+        source = self.line_sources[line]
+        with self.perf.phase('artists'):
+            source['transform'].clear().scale(1, source['y_scale']).translate(source['t_base'] + source['t_offset'], 0)
+
+    def refresh_line(self, line, n_pixels):
+        """
+        Re-slice a plotted line from its decimation pyramid to cover the current time window
+
+        Half a window width is kept on each side so that shifting the line doesn't immediately need a new slice. The
+        line is broken at every gap in the data wider than a pixel, rather than drawn straight across it.
+        """
+        source = self.line_sources[line]
+        margin = self.t_window_width / 2
+        shift = source['t_base'] + source['t_offset']
+        t_start = self.t_window_start.get() - shift
+        t_end = self.t_window_end.get() - shift
+        with self.perf.phase('slicing'):
+            time, values, level = source['pyramid'].window(t_start, t_end, n_pixels, margin=margin)
+            if source['gaps'] is not None:
+                time, values = break_gaps(time, values, source['gaps'].longer_than((t_end - t_start) / n_pixels))
+        with self.perf.phase('artists'):
+            line.set_data(time, values)
+        self.perf.count_points(line.get_label(), len(time))
+        source['extent'] = (t_start - margin, t_end + margin)
+        if line is self.aligning_ts:
+            self.down_sample_current.set(level)
+
+    def refresh_lines(self):
+        n_pixels = self.timeseries_figure.axes[0].bbox.width
+        for line in self.line_sources:
+            self.refresh_line(line, n_pixels)
+
+    def plot_overview(self):
+        """
+        Draw the whole true time stream into the overview strip, with a rectangle marking the current time window
+
+        Only the coarsest level of the decimation pyramid is drawn, and only this once per stream being aligned. After
+        that, moving the window just re-blits the rectangle over the cached background, see update_overview().
+        """
+        from matplotlib.patches import Rectangle
+
+        ax = self.overview_figure.axes[0]
+        for artist in list(ax.lines) + list(ax.patches):
+            artist.remove()
+        time, values = self.true_time_data.pyramid.levels[-1]
+        n_pixels = ax.bbox.width
+        time, values = break_gaps(time, values, self.true_time_data.gaps.longer_than(
+            (self.t_window_end.get() - self.t_window_start.get()) / n_pixels))
+        ax.plot(time + self.true_time_data.offset, values, color='tab:blue', alpha=0.5, linewidth=0.5)
+        ax.set_xlim(self.t_window_start.get(), self.t_window_end.get())
+        ax.set_ylim(*self.true_time_data.pyramid.value_range)
+        self.overview_window = Rectangle(
+            (self.t_window_start.get(), 0), self.t_window_width, 1, transform=ax.get_xaxis_transform(),
+            facecolor='tab:orange', edgecolor='tab:orange', alpha=0.3, animated=True)
+        ax.add_patch(self.overview_window)
+        self.overview_background = None
+        self.overview_canvas.draw()
+
+    def update_overview(self):
+        """Move the window rectangle of the overview strip to the current time window, without redrawing the data"""
+        if self.overview_canvas is None or self.overview_window is None:
+            return
+        self.overview_window.set_x(self.t_window_start.get())
+        self.overview_window.set_width(self.t_window_width)
+        with self.perf.phase('draw'):
+            if self.overview_background is None:
+                self.overview_canvas.draw()
+            else:
+                self.overview_canvas.restore_region(self.overview_background)
+                self.overview_figure.axes[0].draw_artist(self.overview_window)
+                self.overview_canvas.blit(self.overview_figure.axes[0].bbox)
+
+    def on_overview_draw(self, event):
+        self.overview_background = event.canvas.copy_from_bbox(event.canvas.figure.bbox)
+        if self.overview_window is not None:
+            event.canvas.figure.axes[0].draw_artist(self.overview_window)
+
+    def on_overview_press(self, event):
+        """Start dragging the window rectangle, or centre the window on the click if it was outside the rectangle"""
+        if event.inaxes is None or event.button != 1:
+            return
+        start, end = self.view_window
+        if start <= event.xdata <= end:
+            self.overview_grab = event.xdata - start
+        else:
+            self.overview_grab = (end - start) / 2
+            self.request_window(event.xdata - self.overview_grab, event.xdata - self.overview_grab + end - start)
+
+    def on_overview_drag(self, event):
+        if self.overview_grab is None or event.xdata is None:
+            return
+        start, end = self.view_window
+        new_start = event.xdata - self.overview_grab
+        self.request_window(new_start, new_start + end - start)
+
+    def on_overview_release(self, event):
+        self.overview_grab = None
 
     def plot_centerline(self, ax):
         y_lims = ax.get_ylim()
-        self.centerline = ax.plot([1, 1], y_lims, linewidth=0.5, color='black', linestyle='--')[0]
+        self.centerline = ax.plot(
+            [1, 1], y_lims, linewidth=0.5, color='black', linestyle='--', animated=self.blit)[0]
         ax.set_ylim(y_lims)
 
-    def update_canvas(self):
-        self.timeseries_canvas.draw()
-        self.timeseries_canvas.flush_events()
+    @property
+    def animated_artists(self):
+        return [a for a in (self.aligning_ts, self.centerline) if a is not None and a.get_animated()]
+
+    def update_canvas(self, full=True):
+        """
+        Push the current state of the plot to the screen
+
+        :param full: re-render the whole figure. Only needed when something other than the animated artists (the
+            aligning timeseries and the centerline) changed, e.g. the axis limits. Otherwise the cached background is
+            restored and only the animated artists are re-drawn on top of it.
+        """
+        with self.perf.phase('draw'):
+            if full or self.background is None:
+                self.timeseries_canvas.draw()
+            else:
+                self.timeseries_canvas.restore_region(self.background)
+                self.draw_animated()
+                self.timeseries_canvas.blit(self.timeseries_figure.axes[0].bbox)
+            self.timeseries_canvas.flush_events()
+
+    def draw_animated(self):
+        ax = self.timeseries_figure.axes[0]
+        for artist in self.animated_artists:
+            ax.draw_artist(artist)
+
+    def on_draw(self, event):
+        """After every full draw, cache the static background and put the animated artists back on top of it"""
+        if not self.blit:
+            return
+        self.background = event.canvas.copy_from_bbox(event.canvas.figure.bbox)
+        for artist in self.animated_artists:
+            event.canvas.figure.axes[0].draw_artist(artist)
 
     def zoom_in(self, *args):
-        indent = self.t_window_width / (self.zoom_factor.get() * 2)
-        self.t_window_update(
-            self.t_window_start.get() + indent,
-            self.t_window_end.get() - indent
-        )
+        start, end = self.view_window
+        indent = (end - start) / (self.zoom_factor.get() * 2)
+        self.request_window(start + indent, end - indent)
 
-    def next(self, *args):
+    def next(self, *args, accept=True):
+        """
+        Save the offset of the current stream and move on to the next one, or close the window once they are all done
+
+        :param accept: whether the offset was accepted by the user, in which case its drift is estimated. False when
+            stepping back with prev(), and ignored for the call that shows the first stream
+        """
         if self.align_index is None:
-            # Close and exit
-            self.window.quit()
-            self.window.destroy()
+            self.close()
             return
 
+        self.flush_pending()
+        # Nothing has been aligned yet when the first stream is brought up
+        accepted = self.currently_aligning.get() if accept and self.align_index >= 0 else None
         self.complete_alignments[self.currently_aligning.get()] = self.align_offset.get()
         self.align_index += 1
         try:
@@ -324,18 +634,114 @@ class AlignGUI(object):
             self.close_messasge()
         else:
             self.currently_aligning.set(next_name)
+            self.wait_for_view(next_name)
             self.align_offset.set(0.0)
-            self.aligning_ts = self.data_to_align[next_name]
+            self.onset_index = None
+            if self.auto_align:
+                offset, confidence = self.suggestions[next_name]
+                self.align_offset.set(round(offset, 4))
             self.reset_plot()
-            self.plot_all_timeseries()
-            self.update_canvas()
+            notes = [note for note in (self.check_missing(None), self.check_missing(next_name)) if note is not None]
+            if self.auto_align:
+                self.show_suggestion(offset, confidence, notes=notes)
+            elif notes:
+                self.update_status('\n'.join(notes), color='red')
+
+            # Get the following stream ready while this one is being aligned
+            if self.align_index + 1 < len(self.align_names):
+                self.prefetch(self.align_names[self.align_index + 1])
+
+        if self.drift and accepted is not None:
+            self.drift_estimates[accepted] = self.prefetcher.submit(
+                self.measure_drift, accepted, self.complete_alignments[accepted])
+
+    def close(self, *args):
+        """
+        Close the window, writing the performance trace if one was asked for
+
+        Runs both once the last alignment is accepted and when the window is closed by the window manager. Drift
+        estimates still running are left to finish, see drift_results().
+        """
+        for future in [self.onset_candidates, *self.prefetched.values()]:
+            if future is not None:
+                future.cancel()
+        self.prefetcher.shutdown(wait=False)
+        if self.perf_trace is not None:
+            self.perf.export(self.perf_trace)
+        self.window.quit()
+        self.window.destroy()
+
+    def prepare_view(self, name):
+        """
+        Compute everything needed to show one of the streams to align. Safe to run in a worker thread
+
+        Builds the decimation pyramid and gap index of the stream, its z-score scale relative to the true time stream
+        and, if automatic alignment is on, its suggested offset.
+        """
+        stream = self.data_to_align[name]
+        stream.pyramid
+        stream.gaps
+        if name not in self.zscore_scales:
+            # A flat (or entirely missing) stream has no spread to scale by, so it is left as it is
+            scale = self.true_time_data.std / stream.std if stream.std > 0 else np.nan
+            self.zscore_scales[name] = scale if np.isfinite(scale) else 1.0
+        if self.auto_align and name not in self.suggestions:
+            self.suggestions[name] = self.suggest_offset(name)
+
+    def measure_drift(self, name, offset):
+        """
+        Estimate the clock drift of a stream around its accepted offset. Safe to run in a worker thread
+
+        :return: the estimate from estimate_drift(), or None if there wasn't enough signal to make one
+        """
+        data = self.data_to_align[name]
+        try:
+            return estimate_drift(
+                self.true_time_data.plot_time, self.true_time_data.values, data.plot_time, data.values, offset)
+        except ValueError:
+            return None
+
+    def drift_results(self):
+        """Wait for the drift estimate of every accepted stream, as a dictionary of name: estimate (or None)"""
+        return {name: future.result() for name, future in self.drift_estimates.items()}
+
+    def check_missing(self, name):
+        """
+        Set the data missing flag the first time a stream with more missing samples than missing_threshold is shown
+
+        :param name: name of the stream to align, or None for the true time stream
+        :return: note on the missing data to show in the status area if the flag was set, otherwise None
+        """
+        if self.missing_threshold is None or name in self.missing_checked:
+            return None
+        self.missing_checked.add(name)
+        stream = self.true_time_data if name is None else self.data_to_align[name]
+        percent = stream.gaps.percent_missing
+        if percent <= self.missing_threshold:
+            return None
+        self.data_missing_flag.set(True)
+        return (f"{percent:.1f}% of {'True Time' if name is None else name} is missing ({len(stream.gaps)} gaps), "
+                f"data missing flag set")
+
+    def prefetch(self, name):
+        """Start preparing a stream in the background, unless that has already been done"""
+        if name not in self.prefetched:
+            self.prefetched[name] = self.prefetcher.submit(self.prepare_view, name)
+
+    def view_ready(self, name):
+        return name in self.prefetched and self.prefetched[name].done()
+
+    def wait_for_view(self, name):
+        """Block until a stream has been prepared, preparing it now if it wasn't prefetched"""
+        self.prefetch(name)
+        self.prefetched[name].result()
 
     def prev(self, *args):
         try:
             self.align_index -= 2
         except TypeError:
             self.align_index = -2
-        self.next()
+        self.next(accept=False)
 
     @property
     def t_window_width(self):
@@ -346,30 +752,66 @@ class AlignGUI(object):
         return self.data_to_align[self.currently_aligning.get()]
 
     def zoom_out(self, *args):
-        new_width = self.t_window_width / (1 - 1 / self.zoom_factor.get())
+        start, end = self.view_window
+        new_width = (end - start) / (1 - 1 / self.zoom_factor.get())
         un_indent = new_width / (2 * self.zoom_factor.get())
-        self.t_window_update(
-            self.t_window_start.get() - un_indent,
-            self.t_window_end.get() + un_indent
-        )
+        self.request_window(start - un_indent, end + un_indent)
 
     def look_left(self, *args):
-        self.t_window_update(
-            self.t_window_start.get() - self.t_window_width / self.look_factor.get(),
-            self.t_window_end.get() - self.t_window_width / self.look_factor.get()
-        )
+        start, end = self.view_window
+        step = (end - start) / self.look_factor.get()
+        self.request_window(start - step, end - step)
 
     def look_right(self, *args):
-        self.t_window_update(
-            self.t_window_start.get() + self.t_window_width / self.look_factor.get(),
-            self.t_window_end.get() + self.t_window_width / self.look_factor.get()
-        )
+        start, end = self.view_window
+        step = (end - start) / self.look_factor.get()
+        self.request_window(start + step, end + step)
 
     def shift_left(self, *args):
-        self.update_alignment(-1 * self.t_window_width / self.shift_factor.get())
+        start, end = self.view_window
+        self.request_shift(-1 * (end - start) / self.shift_factor.get())
 
     def shift_right(self, *args):
-        self.update_alignment(self.t_window_width / self.shift_factor.get())
+        start, end = self.view_window
+        self.request_shift((end - start) / self.shift_factor.get())
+
+    @property
+    def view_window(self):
+        """(start, end) of the time window, including any moves still waiting to be drawn"""
+        if self.pending_window is not None:
+            return self.pending_window
+        return self.t_window_start.get(), self.t_window_end.get()
+
+    def request_window(self, start, end):
+        """Move the time window, coalescing with any other moves made before the next redraw"""
+        if not self.coalesce_keys:
+            return self.t_window_update(start, end)
+        self.pending_window = (start, end)
+        self.schedule_flush()
+
+    def request_shift(self, shift):
+        """Shift the aligning timeseries, coalescing with any other shifts made before the next redraw"""
+        if not self.coalesce_keys:
+            return self.update_alignment(shift)
+        self.pending_shift += shift
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        if self.flush_id is None:
+            self.flush_id = self.window.after_idle(self.flush_pending)
+
+    def flush_pending(self, *args):
+        """Apply every pending window move and shift at once, with a single redraw"""
+        if self.flush_id is not None:
+            self.window.after_cancel(self.flush_id)
+            self.flush_id = None
+        window, shift = self.pending_window, self.pending_shift
+        self.pending_window, self.pending_shift = None, 0.0
+
+        if shift:
+            self.update_alignment(shift, draw=window is None)
+        if window is not None:
+            self.t_window_update(*window)
 
     def scale_up(self, *args):
         self.rescale(self.scale_factor.get())
@@ -389,41 +831,162 @@ class AlignGUI(object):
         ymin = 1.1 * min(mins) if min(mins) < 0 else 0.9 * min(mins)
         self.timeseries_figure.axes[0].set_ylim([ymin, ymax])
 
+    @timed
     def rescale(self, multiplier):
-        yscaled = self.aligning_ts.get_ydata() * multiplier
-        self.aligning_ts.set_ydata(yscaled)
+        self.flush_pending()
+        for line in [self.aligning_ts] + self.other_ts:
+            self.line_sources[line]['y_scale'] *= multiplier
+            self.update_line_transform(line)
 
-        for i, other_ts in enumerate(self.other_ts):
-            other_scale = other_ts.get_ydata() * multiplier
-            self.other_ts[i].set_ydata(other_scale)
-
-        self.update_ylims([yscaled, self.ground_truth_ts.get_ydata()])
+        yscaled = np.array(self.aligning_data.pyramid.value_range) * self.line_sources[self.aligning_ts]['y_scale']
+        self.update_ylims([yscaled, np.array(self.true_time_data.pyramid.value_range)])
         self.update_canvas()
         self.current_scale.set(self.current_scale.get() * multiplier)
 
     def zscore_rescale(self, *args):
 
-        base_scale = np.std(self.ground_truth_ts.get_ydata())
-        rel_scale = np.std(self.aligning_ts.get_ydata())
+        name = self.currently_aligning.get()
+        self.wait_for_view(name)
 
-        new_scale = base_scale / rel_scale
+        new_scale = self.zscore_scales[name] / self.line_sources[self.aligning_ts]['y_scale']
         self.rescale(new_scale)
 
     def fine_shift_amt(self):
-        times = self.aligning_ts.get_xdata()
-        return np.median(np.diff(times[:100]))
+        return self.aligning_data.sample_interval
 
     def fine_shift_left(self, *args):
-        self.update_alignment(-self.fine_shift_amt())
+        self.request_shift(-self.fine_shift_amt())
 
     def fine_shift_right(self, *args):
-        self.update_alignment(self.fine_shift_amt())
+        self.request_shift(self.fine_shift_amt())
 
-    def update_alignment(self, new_shift):
-        new_ts = self.aligning_ts.get_xdata() + new_shift
-        self.aligning_ts.set_xdata(new_ts)
+    @timed
+    def update_alignment(self, new_shift, draw=True):
         self.align_offset.set(round(self.align_offset.get() + new_shift, 4))
-        self.update_canvas()
+        source = self.line_sources[self.aligning_ts]
+        source['t_offset'] = self.align_offset.get()
+        self.update_line_transform(self.aligning_ts)
+
+        # Only fetch a new slice once the shift has moved the visible window outside of the one already plotted
+        shift = source['t_base'] + source['t_offset']
+        if not (source['extent'][0] <= self.t_window_start.get() - shift and
+                self.t_window_end.get() - shift <= source['extent'][1]):
+            self.refresh_line(self.aligning_ts, self.timeseries_figure.axes[0].bbox.width)
+        if draw:
+            self.update_canvas(full=False)
+
+    def suggest_offset(self, name, search_window=None, ref_window=None):
+        """
+        Estimate the offset of one of the streams to align by cross-correlating it with the true time stream
+
+        :param name: name of the stream to align
+        :param search_window: optional (min_offset, max_offset) tuple, in seconds, limiting the offsets considered
+        :param ref_window: optional (start, end) tuple, in seconds, of the part of the true time stream to correlate
+            against. Only the samples of the stream that can land in it at an offset inside search_window are then
+            read, so the cost depends on the window rather than the length of the recording. Needs search_window
+        :return: tuple of (offset, confidence). If no estimate can be made, the offset is 0.0 and confidence None
+        """
+        data = self.data_to_align[name]
+        ref_time, ref_values = self.true_time_data.plot_time, self.true_time_data.values
+        time, values = data.plot_time, data.values
+        if ref_window is not None:
+            start, end = ref_window
+            ref_time, ref_values = self.true_time_data.window(start, end)
+            time, values = data.window(start - search_window[1], end - search_window[0])
+            if len(ref_time) < 2 or len(time) < 2:
+                return 0.0, None
+        try:
+            return estimate_lag(ref_time, ref_values, time, values, search_window=search_window)
+        except ValueError:
+            return 0.0, None
+
+    def toggle_perf_hud(self, *args):
+        """Show or hide the timing of every redraw in the status area. Turns on recording if it was off"""
+        if self.perf.listener is None:
+            self.perf.enabled = True
+            self.perf.listener = self.show_perf
+            self.update_status('Performance HUD on')
+        else:
+            self.perf.listener = None
+            self.update_status('Performance HUD off')
+
+    def show_perf(self, record):
+        # Only set the variable: forcing a label update here would add a redraw to every event being measured
+        self.status.set(self.perf.summary(record))
+        self.status_label.config(fg='black')
+
+    def show_suggestion(self, offset, confidence, notes=()):
+        """Show a suggested offset in the status area, followed by any notes (which turn the status red)"""
+        if confidence is None:
+            status, color = 'No automatic alignment could be found', 'red'
+        else:
+            status, color = f'Suggested offset: {offset:.4f} s (confidence {confidence:.2f})', 'black'
+        self.update_status('\n'.join([status, *notes]), color='red' if notes else color)
+
+    def align_in_view(self, *args):
+        """
+        Jump to the best cross-correlation offset within half a window width of the current offset
+
+        Only the true time data in view is correlated, against the part of the stream that can be shifted into view, so
+        this stays fast on long recordings.
+        """
+        self.flush_pending()
+        half_width = self.t_window_width / 2
+        current = self.align_offset.get()
+        offset, confidence = self.suggest_offset(
+            self.currently_aligning.get(), search_window=(current - half_width, current + half_width),
+            ref_window=(self.t_window_start.get(), self.t_window_end.get()))
+        if confidence is not None:
+            self.update_alignment(offset - current)
+        self.show_suggestion(offset, confidence)
+
+    def next_onset(self, *args):
+        self.jump_to_onset(1)
+
+    def prev_onset(self, *args):
+        self.jump_to_onset(-1)
+
+    def jump_to_onset(self, step):
+        """
+        Centre the time window on a candidate gesture of the true time stream or of the stream being aligned
+
+        Candidates are visited in order of strength, those of the stream being aligned shifted by its current offset so
+        they are where the stream is drawn. The window keeps its width, up to onset_view_width seconds. The true time
+        candidates are indexed in the background once the first stream is shown, see begin_alignment().
+
+        :param step: 1 for the next weaker candidate, -1 for the previous stronger one
+        """
+        if not self.onset_candidates.done():
+            self.update_status('Indexing gesture candidates...')
+        times, strengths, sources = self.gesture_candidates()
+        if not len(times):
+            self.update_status('No gesture candidates found', color='red')
+            return
+        if self.onset_index is None:
+            self.onset_index = 0 if step > 0 else len(times) - 1
+        else:
+            self.onset_index = (self.onset_index + step) % len(times)
+
+        start, end = self.view_window
+        half_width = min(end - start, self.onset_view_width.get()) / 2
+        center = times[self.onset_index]
+        self.request_window(center - half_width, center + half_width)
+        self.update_status(f'Gesture candidate {self.onset_index + 1} of {len(times)} at {center:.1f} s in '
+                           f'{sources[self.onset_index]} (strength {strengths[self.onset_index]:.1f})')
+
+    def gesture_candidates(self):
+        """
+        Candidate gestures of the true time stream and of the stream being aligned, strongest first
+
+        :return: tuple of (times, strengths, sources) arrays, with the name of the stream each candidate was found in
+        """
+        true_times, true_strengths = self.onset_candidates.result()
+        aligning_times, aligning_strengths = self.aligning_data.onsets
+        times = np.concatenate([true_times, aligning_times + self.align_offset.get()])
+        strengths = np.concatenate([true_strengths, aligning_strengths])
+        sources = np.array(['True Time'] * len(true_times) + [self.currently_aligning.get()] * len(aligning_times))
+        order = np.argsort(-strengths, kind='stable')
+        return times[order], strengths[order], sources[order]
 
     def data_warn(self, *args):
         self.data_missing_flag.set(not self.data_missing_flag.get())
@@ -437,7 +1000,8 @@ class AlignGUI(object):
     def comment(self, *args):
         self.extra_comment.set(simpledialog.askstring('Custom Comment', 'Enter Comment:'))
 
-    def t_window_update(self, start=None, end=None):
+    @timed
+    def t_window_update(self, start=None, end=None, redraw=False):
         if start is None:
             start = self.t_window_start.get()
         else:
@@ -448,15 +1012,22 @@ class AlignGUI(object):
         else:
             self.t_window_end.set(end)
 
+        ax = self.timeseries_figure.axes[0]
+        limits_changed = redraw or tuple(ax.get_xlim()) != (start, end)
+
         center_seconds = (self.t_window_start.get() + self.t_window_end.get()) / 2
         center_time = self.start_time + pd.Timedelta(center_seconds, unit='s')
         t_label = f"{center_time.strftime('%Y-%m-%d %X')}.{ round(center_time.microsecond/10**4)}"
         self.t_center.set(t_label)
         self.centerline.set_xdata([center_seconds, center_seconds])
 
-        self.timeseries_figure.axes[0].set_title(t_label, y=1.0, pad=-14)
-        self.timeseries_figure.axes[0].set_xlim([start, end])
-        self.update_canvas()
+        if limits_changed:
+            ax.set_title(t_label, y=1.0, pad=-14)
+            ax.set_xlim([start, end])
+            self.refresh_lines()
+        self.update_canvas(full=limits_changed)
+        if limits_changed:
+            self.update_overview()
 
     def run(self):
         self.update_status('Press ENTER to begin...')
@@ -473,60 +1044,61 @@ class AlignGUI(object):
         traceback.print_exception(err, note, tb)
 
     def set_data_lims(self):
-        self.t_window_start.set(min(self.true_time_data.index[0], self.aligning_data.index[0]))
-        self.t_window_end.set(max(self.true_time_data.index[-1], self.aligning_data.index[-1]))
+        self.t_window_start.set(min(self.true_time_data.start, self.aligning_data.start))
+        self.t_window_end.set(max(self.true_time_data.end, self.aligning_data.end))
 
     @staticmethod
     def soft_total_seconds(times, start):
-        try:
-            seconds = timestamp_to_elapsed(times, start=start)
-        except AttributeError:
-            seconds = times
-        return seconds
+        if pd.api.types.is_datetime64_any_dtype(times) or pd.api.types.is_timedelta64_dtype(times):
+            return timestamp_to_elapsed(times, start=start)
+        # Anything that isn't a timestamp is assumed to already be in seconds
+        return np.asarray(times, dtype=float)
 
     def prep_stream(self, source, start_time):
         """
-        Prepare a DataFrame containing raw data for plotting
+        Prepare a Stream containing raw data for plotting
 
             - Median-center the data stream
             - Use time (seconds) relative to the earliest plot time.
-            - Time index the dataframe using a consistent data name
 
-        :param source: Original unprepared dataframe
+        :param source: Original unprepared dataframe, or an OnDiskRecording (which is already median-centered)
         :param start_time: Start time of the plot, all data will be plotted relative to this time
-        :return:
+        :return: Stream with the first column of source as its values
         """
-        data_values = source[source.columns[0]]
-        centered = data_values - np.nanmedian(data_values)
-        new_time = self.soft_total_seconds(source.index, start_time)
-        ready = pd.DataFrame.from_dict(
-            {self.plot_axis.get(): centered, 'time': new_time},
-        ).set_index('time')
-        return ready
+        if isinstance(source, OnDiskRecording):
+            return source.stream(start_time)
+        return Stream.centered(
+            self.soft_total_seconds(source.index, start_time),
+            source[source.columns[0]].to_numpy()
+        )
 
+    @timed
     def prep_data(self, true_time_src, other_sources):
         """
         Collect the passed in raw data into a plotting-ready simplified form
 
         The main task this function accomplishes are:
-            - Calling prep_stream() for every modality (see above)
+            - Calling prep_stream() for the true time modality (see above)
             - Populate as list of names of all the modalities to align for consistent cycling through
-            - Fill a dictionary (using above names) with ready-to-use data
+            - Set up a lazy mapping (using above names) that calls prep_stream() for each modality when first used
             - Prepare a dictionary (using above names) ready to be filled with per-modality offsets
 
-        :param true_time_src: DataFrame containing the data stream considered to be 'true' time
-        :param other_sources: dictionary of any number of other DataFrames, each containing data for one other
-        modality that needs to be aligned relative to the 'true' time series
+        :param true_time_src: DataFrame (or OnDiskRecording) containing the data stream considered to be 'true' time
+        :param other_sources: dictionary of any number of other DataFrames (or OnDiskRecordings), each containing data
+        for one other modality that needs to be aligned relative to the 'true' time series
         """
 
-        self.start_time = true_time_src.index[0]
+        self.update_status('Preparing true time data...')
+        if isinstance(true_time_src, OnDiskRecording):
+            self.start_time = true_time_src.start
+        else:
+            self.start_time = true_time_src.index[0]
         self.true_time_data = self.prep_stream(true_time_src, self.start_time)
 
-        self.data_to_align = {}
+        # Streams to align are only prepared once they are first needed, see prefetch()
+        self.data_to_align = LazyStreams(other_sources, lambda source: self.prep_stream(source, self.start_time))
         self.align_names = []
         self.complete_alignments = {}
-        for name, source in other_sources.items():
-            other_src = self.prep_stream(source, self.start_time)
-            self.data_to_align[name] = other_src
+        for name in other_sources:
             self.align_names.append(name)
             self.complete_alignments[name] = 0.0
@@ -0,0 +1,80 @@
+import tkinter as tk
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from aligner.gui import AlignGUI
+
+
+class NullWidget(object):
+    """Stands in for the Tk widgets that AlignGUI updates, when there is no window to put them in"""
+
+    def config(self, **kwargs):
+        pass
+
+    def update(self):
+        pass
+
+
+class HeadlessAlignGUI(AlignGUI):
+    """
+    AlignGUI that draws to an off-screen Agg canvas instead of a Tk window
+
+    Every plotting and navigation method works as in the GUI, so this can be driven programmatically to render plots
+    or measure redraw latency on machines without a display. Only a Tcl interpreter is created, to hold the Tk
+    variables. Key presses are applied immediately since there is no event loop to coalesce them in.
+    """
+
+    def __init__(self, true_time_source=None, align_sources=None, width=1600, height=900, **kwargs):
+        """
+        :param width: width, in pixels, of the window being simulated. The plot takes up 3/4 of it, as in the GUI
+        :param height: height, in pixels, of the window being simulated
+        """
+        self.size = (height, width)
+        super().__init__(true_time_source, align_sources, **kwargs)
+
+    @property
+    def window_dims(self):
+        return self.size
+
+    def init_window(self):
+        self.window = tk.Tcl()
+
+    def init_layout(self):
+        self.status_label = NullWidget()
+
+    def bind_keys(self):
+        pass
+
+    def init_figure(self):
+        self.destroy_plot()
+        self.create_canvases()
+
+    def new_canvas(self, fig):
+        return FigureCanvasAgg(fig)
+
+    def close_messasge(self):
+        self.destroy_plot()
+
+    def show_alignment(self, name, offset, offsets=None, scale=None):
+        """
+        Plot one of the streams at a given offset, over the whole recording
+
+        :param name: name of the stream to show in orange
+        :param offset: offset of that stream, in seconds
+        :param offsets: dictionary of name: offset, in seconds, for the other streams drawn in gray
+        :param scale: display scale of the stream. Defaults to its z-score scale
+        """
+        for other in self.align_names:
+            self.wait_for_view(other)
+        self.complete_alignments.update(offsets or {})
+        self.align_index = self.align_names.index(name)
+        self.currently_aligning.set(name)
+        self.align_offset.set(offset)
+        self.current_scale.set(self.zscore_scales[name] if scale is None else scale)
+        self.plot_all_timeseries()
+
+    def close(self, *args):
+        """Stop the background thread preparing the streams, and write the performance trace if one was asked for"""
+        self.prefetcher.shutdown(wait=True)
+        if self.perf_trace is not None:
+            self.perf.export(self.perf_trace)
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def rolling_rms(time, values, window):
+    """
+    Root mean square of a time series over a sliding window centered on every sample
+
+    Computed from cumulative sums in a single vectorized pass, so the cost doesn't depend on the window length. The
+    window is defined in time, so irregular sampling and gaps are handled. NaN samples are left out.
+
+    :param time: sorted 1-D array of sample times, in seconds
+    :param values: 1-D array of sample values, same length as time
+    :param window: width of the window, in seconds
+    :return: float64 array of the RMS around every sample
+    """
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    energy = np.concatenate([[0.0], np.cumsum(np.where(finite, values * values, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(finite)])
+
+    i0 = np.searchsorted(time, time - window / 2, side='left')
+    i1 = np.searchsorted(time, time + window / 2, side='right')
+    n = counts[i1] - counts[i0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt((energy[i1] - energy[i0]) / n)
+
+
+def find_onsets(time, values, window=0.5, min_separation=10.0, max_candidates=20):
+    """
+    Find the bursts of energy in a time series that are most likely to be a synchronization gesture
+
+    The RMS envelope of the series is split into blocks half of min_separation long and the peak of each block is a
+    candidate. Candidates are then taken from strongest to weakest, skipping any within min_separation of one already
+    taken. Strength is the peak RMS relative to the median RMS of the whole series, so it is comparable between streams.
+
+    :param time: sorted 1-D array of sample times, in seconds
+    :param values: 1-D array of median-centered sample values
+    :param window: width of the RMS window, in seconds. Roughly the length of the gesture
+    :param min_separation: minimum time, in seconds, between two candidates
+    :param max_candidates: maximum number of candidates to return
+    :return: tuple of (times, strengths) arrays, strongest candidate first
+    """
+    time = np.asarray(time)
+    # No blocks to split the series into without at least two samples spanning some time
+    if len(time) < 2 or not time[-1] > time[0]:
+        return np.empty(0), np.empty(0)
+    rms = rolling_rms(time, values, window)
+    background = np.nanmedian(rms)
+    if not background > 0:
+        background = np.nanmean(rms) if np.nanmean(rms) > 0 else 1.0
+
+    # Peak of every block, in one pass via reduceat on the block boundaries
+    block_edges = np.arange(time[0], time[-1], min_separation / 2)
+    starts = np.unique(np.searchsorted(time, block_edges, side='left'))
+    filled = np.where(np.isnan(rms), -np.inf, rms)
+    block_peaks = np.maximum.reduceat(filled, starts)
+    peak_idx = _block_argmax(filled, starts, block_peaks)
+
+    taken = []
+    for i in np.argsort(block_peaks)[::-1]:
+        if len(taken) == max_candidates or not np.isfinite(block_peaks[i]):
+            break
+        t = time[peak_idx[i]]
+        if all(abs(t - time[j]) >= min_separation for j in taken):
+            taken.append(peak_idx[i])
+    taken = np.asarray(taken, dtype=np.int64)
+    return time[taken].astype(np.float64), rms[taken] / background
+
+
+def _block_argmax(filled, starts, block_peaks):
+    """Index of the first sample in every block that reaches the peak of its block"""
+    block_of = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(filled))))
+    is_peak = filled == block_peaks[block_of]
+    peak_samples = np.flatnonzero(is_peak)
+    first = np.unique(block_of[peak_samples], return_index=True)[1]
+    return peak_samples[first]
+
+
+def envelope_level(pyramid, max_points=2 ** 21):
+    """
+    Pick the finest level of a decimation pyramid small enough to compute the RMS envelope over in memory
+
+    Min/max decimation keeps the extremes of every bucket, so bursts of energy stand out at every level.
+
+    :return: tuple of (time, values) arrays of that level
+    """
+    for time, values in pyramid.levels:
+        if len(time) <= max_points:
+            return time, values
+    return pyramid.levels[-1]
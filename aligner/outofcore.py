@@ -0,0 +1,301 @@
+"""
+Out-of-core ingest for recordings too large to load into memory
+
+ingest_csv() reads a csv in chunks and writes the L2 norm of its data columns and the elapsed sample times to flat
+binary files on disk, along with every level of the min/max decimation pyramid. The result is an OnDiskRecording,
+which AlignGUI and manual_align accept anywhere a DataFrame is accepted. Its arrays are memory-mapped, so only the
+pages covering the plotted window (at the level of decimation being drawn) are ever read in.
+
+Each recording is stored as a directory of `time_{level}.bin` and `values_{level}.bin` files plus a meta.json holding
+their lengths and the statistics of the recording (start time, median, standard deviation, value range, gap index).
+meta.json is
+written last, so a directory without it is an incomplete ingest.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from aligner.cache import CSVCache, DEFAULT_CACHE_DIR
+from aligner.decimate import MinMaxPyramid, interleave_extrema, reduce_extrema
+from aligner.gaps import GapIndex, gap_index
+from aligner.stream import Stream
+from aligner.utils import col_names, epoch_to_datetime, norm_df
+
+DEFAULT_CHUNK_SIZE = 2 ** 20
+META_FILE = 'meta.json'
+
+
+def ingest_csv(file_path, out_dir=None, time_scale_to_seconds=1.0, column_names=None, dtype=None,
+               chunk_size=DEFAULT_CHUNK_SIZE, factor=4, min_points=2000):
+    """
+    Norm a csv file with timestamps in the first column into memory-mapped arrays on disk, one chunk at a time
+
+    :param file_path: path to the csv file
+    :param out_dir: directory to store the recording in. Defaults to a directory under $ALIGNER_CACHE_DIR/ondisk (or
+        ~/.cache/aligner/ondisk) keyed by the file and these parameters, so an unchanged file is only ingested once
+    :param time_scale_to_seconds: number of timestamp units in one second (e.g. 1000 for timestamps in milliseconds)
+    :param column_names: columns to include in the norm. By default all columns except those including 'time'
+    :param dtype: dtype to store the normed values in, e.g. np.float32 to halve the disk use. Defaults to float64
+    :param chunk_size: number of csv rows read, and array elements processed, at once
+    :param factor: bucket factor of the decimation pyramid, see MinMaxPyramid
+    :param min_points: size of the coarsest level of the decimation pyramid, see MinMaxPyramid
+    :return: OnDiskRecording
+    """
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+    if out_dir is None:
+        base_dir = os.path.join(os.environ.get('ALIGNER_CACHE_DIR', DEFAULT_CACHE_DIR), 'ondisk')
+        keys = CSVCache(base_dir)
+        out_dir = keys.entry_dir(keys.key(
+            file_path, time_scale_to_seconds=time_scale_to_seconds, column_names=column_names, dtype=dtype.str,
+            factor=factor, min_points=min_points
+        ))
+    if os.path.exists(os.path.join(out_dir, META_FILE)):
+        return OnDiskRecording(out_dir)
+
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.staging-')
+    try:
+        meta = write_normed(file_path, staging, time_scale_to_seconds, column_names, dtype, chunk_size)
+        meta['source'] = os.path.abspath(file_path)
+        time = np.memmap(os.path.join(staging, 'time_0.bin'), dtype=np.float64, mode='r', shape=(meta['count'],))
+        values = np.memmap(os.path.join(staging, 'values_0.bin'), dtype=dtype, mode='r+', shape=(meta['count'],))
+
+        meta['median'] = chunked_median(values, meta['finite'], meta['value_range'], chunk_size)
+        meta['std'] = center(values, meta['median'], chunk_size)
+        meta['value_range'] = [v - meta['median'] for v in meta['value_range']]
+        meta['factor'] = factor
+        meta['levels'] = write_pyramid(time, values, staging, factor, min_points, chunk_size)
+        meta['gaps'] = gap_index(time, chunk_size=chunk_size).to_meta()
+        values.flush()
+        del time, values
+
+        with open(os.path.join(staging, META_FILE), 'w') as fh:
+            json.dump(meta, fh)
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(staging, out_dir)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return OnDiskRecording(out_dir)
+
+
+def write_normed(file_path, out_dir, time_scale_to_seconds, column_names, dtype, chunk_size):
+    """
+    First pass: write the elapsed time and the norm of every csv row to time_0.bin and values_0.bin
+
+    :return: meta dictionary with the start time (epoch ns), sample count, finite value count and value range
+    """
+    meta = {'t0': None, 'count': 0, 'finite': 0, 'value_range': [np.inf, -np.inf], 'dtype': dtype.str}
+    reader = pd.read_csv(file_path, header=0, index_col=0, chunksize=chunk_size)
+    with open(os.path.join(out_dir, 'time_0.bin'), 'wb') as time_fh, \
+            open(os.path.join(out_dir, 'values_0.bin'), 'wb') as values_fh:
+        for chunk in reader:
+            ns = epoch_to_datetime(chunk.index, time_scale_to_seconds).asi8
+            if meta['t0'] is None:
+                meta['t0'] = int(ns[0])
+                column_names = col_names(chunk, exclude='time') if column_names is None else column_names
+                meta['columns'] = list(column_names)
+            ((ns - meta['t0']) / 1e9).tofile(time_fh)
+
+            normed = norm_df(chunk, column_names, dtype=dtype).to_numpy()[:, 0]
+            normed.tofile(values_fh)
+            finite = normed[np.isfinite(normed)]
+            if len(finite):
+                meta['value_range'] = [min(meta['value_range'][0], float(finite.min())),
+                                       max(meta['value_range'][1], float(finite.max()))]
+            meta['count'] += len(normed)
+            meta['finite'] += len(finite)
+
+    if meta['count'] == 0:
+        raise ValueError(f'{file_path} has no data rows')
+    if meta['finite'] == 0:
+        meta['value_range'] = [np.nan, np.nan]
+    return meta
+
+
+def chunked_median(values, n_finite, value_range, chunk_size=DEFAULT_CHUNK_SIZE, bins=2 ** 16):
+    """
+    Exact median of the finite entries of an array, reading only chunk_size entries of it at a time
+
+    :param values: 1-D array, typically memory-mapped
+    :param n_finite: number of finite entries in values
+    :param value_range: (min, max) of the finite entries
+    :return: the median, or NaN if there are no finite entries
+    """
+    if n_finite == 0:
+        return np.nan
+    lo_rank, hi_rank = (n_finite - 1) // 2, n_finite // 2
+    lo = kth_smallest(values, lo_rank, value_range, chunk_size, bins)
+    hi = lo if hi_rank == lo_rank else kth_smallest(values, hi_rank, value_range, chunk_size, bins)
+    return (lo + hi) / 2
+
+
+def kth_smallest(values, k, value_range, chunk_size=DEFAULT_CHUNK_SIZE, bins=2 ** 16):
+    """
+    The k-th smallest (from 0) finite entry of an array, found by repeatedly histogramming it chunk by chunk
+
+    Each pass narrows the search down to the one histogram bin holding the k-th entry, until that bin is small enough
+    to gather into memory and partition.
+    """
+    lo, hi = value_range
+    below = 0
+    while lo < hi:
+        scale = bins / (hi - lo)
+        counts = np.zeros(bins, dtype=np.int64)
+        for in_range, bin_idx in _binned_chunks(values, lo, hi, scale, bins, chunk_size):
+            counts += np.bincount(bin_idx, minlength=bins)
+
+        cumulative = np.cumsum(counts)
+        idx = int(np.searchsorted(cumulative, k - below, side='right'))
+        below += int(cumulative[idx - 1]) if idx > 0 else 0
+
+        # Binning is monotonic in value, so the entries of bin idx are exactly those between its min and max
+        if counts[idx] <= chunk_size:
+            gathered = np.concatenate([v[b == idx] for v, b in _binned_chunks(values, lo, hi, scale, bins, chunk_size)])
+            return float(np.partition(gathered, k - below)[k - below])
+        bin_lo, bin_hi = np.inf, -np.inf
+        for in_range, bin_idx in _binned_chunks(values, lo, hi, scale, bins, chunk_size):
+            in_bin = in_range[bin_idx == idx]
+            if len(in_bin):
+                bin_lo, bin_hi = min(bin_lo, in_bin.min()), max(bin_hi, in_bin.max())
+        lo, hi = bin_lo, bin_hi
+    return float(lo)
+
+
+def _binned_chunks(values, lo, hi, scale, bins, chunk_size):
+    """Yield the entries of each chunk that fall in [lo, hi], along with the histogram bin of each"""
+    for start in range(0, len(values), chunk_size):
+        chunk = np.asarray(values[start:start + chunk_size])
+        in_range = chunk[(chunk >= lo) & (chunk <= hi)]
+        bin_idx = np.minimum(((in_range - lo) * scale).astype(np.int64), bins - 1)
+        yield in_range, bin_idx
+
+
+def center(values, median, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Subtract the median from a writable array in place, chunk by chunk
+
+    :return: standard deviation of the finite entries
+    """
+    total, total_sq, count = 0.0, 0.0, 0
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        chunk -= median
+        finite = chunk[np.isfinite(chunk)].astype(np.float64)
+        total += finite.sum()
+        total_sq += np.dot(finite, finite)
+        count += len(finite)
+    if count == 0:
+        return np.nan
+    mean = total / count
+    return float(np.sqrt(max(total_sq / count - mean ** 2, 0.0)))
+
+
+def write_pyramid(time, values, out_dir, factor=4, min_points=2000, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Build the levels of a min/max decimation pyramid on disk, streaming level 0 through once
+
+    Gives the same levels as MinMaxPyramid. Each level carries its incomplete last bucket over to the next chunk, so
+    chunk boundaries don't change the result.
+
+    :return: list of the number of points in each level, starting with level 0
+    """
+    n_buckets = [len(values)]
+    while 2 * n_buckets[-1] / factor >= min_points:
+        n_buckets.append(-(-n_buckets[-1] // factor))
+    points = [len(values)] + [2 * n for n in n_buckets[1:]]
+
+    outputs = [None] + [
+        (np.memmap(os.path.join(out_dir, f'time_{level}.bin'), dtype=np.float64, mode='w+', shape=(n,)),
+         np.memmap(os.path.join(out_dir, f'values_{level}.bin'), dtype=np.float64, mode='w+', shape=(n,)))
+        for level, n in enumerate(points) if level > 0
+    ]
+    written = [0] * len(points)
+    carry = [None] * len(points)
+
+    for start in range(0, len(values), chunk_size):
+        last = start + chunk_size >= len(values)
+        lo_t = hi_t = np.asarray(time[start:start + chunk_size])
+        chunk = np.asarray(values[start:start + chunk_size], dtype=np.float64)
+        lo = np.where(np.isnan(chunk), np.inf, chunk)
+        hi = np.where(np.isnan(chunk), -np.inf, chunk)
+
+        for level in range(1, len(points)):
+            if carry[level] is not None:
+                lo_t, lo, hi_t, hi = (np.concatenate(pair) for pair in zip(carry[level], (lo_t, lo, hi_t, hi)))
+            n_complete = len(lo) if last else len(lo) // factor * factor
+            carry[level] = tuple(a[n_complete:] for a in (lo_t, lo, hi_t, hi))
+            if n_complete == 0:
+                break
+            lo_t, lo = reduce_extrema(lo_t[:n_complete], lo[:n_complete], factor, np.argmin, np.inf)
+            hi_t, hi = reduce_extrema(hi_t[:n_complete], hi[:n_complete], factor, np.argmax, -np.inf)
+
+            level_time, level_values = interleave_extrema(lo_t, lo, hi_t, hi)
+            out_time, out_values = outputs[level]
+            out_time[written[level]:written[level] + len(level_time)] = level_time
+            out_values[written[level]:written[level] + len(level_values)] = level_values
+            written[level] += len(level_time)
+
+    for out_time, out_values in outputs[1:]:
+        out_time.flush()
+        out_values.flush()
+    return points
+
+
+class OnDiskRecording(object):
+    """
+    A normed recording written to disk by ingest_csv()
+
+    Pass it to AlignGUI or manual_align in place of a DataFrame. Its Stream is backed by memory-mapped files, so
+    preparing it reads nothing but the first and last samples.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: directory the recording was ingested into
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as fh:
+            self.meta = json.load(fh)
+        self.start = pd.Timestamp(self.meta['t0'])
+
+    def __len__(self):
+        return self.meta['count']
+
+    def levels(self):
+        """
+        Memory-map every level of the decimation pyramid
+
+        :return: list of (time, values) memmap pairs, starting with the raw samples
+        """
+        levels = []
+        for level, n in enumerate(self.meta['levels']):
+            dtype = self.meta['dtype'] if level == 0 else np.float64
+            levels.append((
+                np.memmap(os.path.join(self.path, f'time_{level}.bin'), dtype=np.float64, mode='r', shape=(n,)),
+                np.memmap(os.path.join(self.path, f'values_{level}.bin'), dtype=dtype, mode='r', shape=(n,)),
+            ))
+        return levels
+
+    def stream(self, start=None):
+        """
+        Get the recording as a Stream
+
+        The sample times on disk are measured from the first sample of the recording. A different start only sets the
+        offset of the Stream, so nothing but the first and last samples is read either way.
+
+        :param start: time to measure sample times from. Defaults to the first sample of the recording
+        :return: Stream with the median-centered norm as its values and its decimation pyramid and gap index already
+            attached
+        """
+        start_ns = self.meta['t0'] if start is None else pd.Timestamp(start).value
+        levels = self.levels()
+        pyramid = MinMaxPyramid.from_levels(levels, self.meta['factor'], self.meta['value_range'])
+        # Recordings ingested before the gap index was stored get theirs built from the time array when first needed
+        gaps = GapIndex.from_meta(self.meta['gaps']) if 'gaps' in self.meta else None
+        return Stream(levels[0][0], levels[0][1], median=self.meta['median'], pyramid=pyramid, std=self.meta['std'],
+                      gaps=gaps, offset=(self.meta['t0'] - start_ns) / 1e9)
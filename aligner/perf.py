@@ -0,0 +1,100 @@
+import functools
+import json
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class PerfRecorder(object):
+    """
+    Lightweight timing of GUI handlers
+
+    Each call of an instrumented handler becomes an event with its total duration, the time spent in each named phase
+    inside it (e.g. data slicing, artist updates, canvas drawing) and the number of points drawn per line. A rolling
+    history per handler is kept for percentiles and, if asked for, every event is kept to be exported as a JSON trace.
+    When disabled, recording costs one attribute check per call.
+    """
+
+    def __init__(self, enabled=False, history=200, keep_trace=False):
+        """
+        :param enabled: start recording straight away
+        :param history: number of recent events per handler to compute percentiles over
+        :param keep_trace: keep every event for export(). Otherwise only the rolling history is kept, so recording can
+            stay on for a session of any length
+        """
+        self.enabled = enabled
+        self.history = defaultdict(lambda: deque(maxlen=history))
+        self.keep_trace = keep_trace
+        self.trace = []
+        self.listener = None
+        self._stack = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def event(self, name):
+        """Time one call of a handler. Nested calls are recorded as separate events"""
+        if not self.enabled:
+            yield
+            return
+        record = {'name': name, 'start': time.perf_counter() - self._origin, 'phases': defaultdict(float),
+                  'points': {}}
+        self._stack.append(record)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['total'] = time.perf_counter() - t0
+            self._stack.pop()
+            record['phases'] = dict(record['phases'])
+            self.history[name].append(record['total'])
+            if self.keep_trace:
+                self.trace.append(record)
+            if self.listener is not None and not self._stack:
+                self.listener(record)
+
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent in this block to the named phase of the current event"""
+        if not self.enabled or not self._stack:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stack[-1]['phases'][name] += time.perf_counter() - t0
+
+    def count_points(self, line_name, n_points):
+        """Record the number of points drawn for a line during the current event"""
+        if self.enabled and self._stack:
+            self._stack[-1]['points'][line_name] = int(n_points)
+
+    def percentiles(self, name, q=(50, 95)):
+        """Rolling percentiles of a handler's duration, in seconds, or None if it hasn't been recorded"""
+        if not self.history[name]:
+            return None
+        return tuple(np.percentile(self.history[name], q))
+
+    def summary(self, record):
+        """One-line description of an event and the rolling percentiles of its handler"""
+        p50, p95 = self.percentiles(record['name'])
+        phases = ' '.join(f'{k} {1000 * v:.1f}' for k, v in record['phases'].items())
+        points = sum(record['points'].values())
+        return (f"{record['name']}: {1000 * record['total']:.1f} ms (p50 {1000 * p50:.1f}, p95 {1000 * p95:.1f})"
+                f"\n{phases} | {points} pts")
+
+    def export(self, file_path):
+        """Write every recorded event to a JSON file"""
+        with open(file_path, 'w') as fh:
+            json.dump(self.trace, fh, indent=1)
+
+
+def timed(method):
+    """Record every call of an AlignGUI method as an event of its `perf` recorder"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.perf.event(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
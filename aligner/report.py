@@ -0,0 +1,225 @@
+"""
+Quality control report of accepted alignments
+
+For every aligned stream two plots are rendered off-screen, with the same plotting code as the GUI: a zoomed-in window
+around the synchronization gesture (the strongest gesture candidate of the true time stream within the time covered by
+the aligned stream) and the whole recording.
+Sessions are rendered in parallel in worker processes, into PNG files and an index.html to review them all at once:
+
+    report/
+        index.html
+        subject01_day1/
+            rcs_left_gesture.png
+            rcs_left_overview.png
+            ...
+
+Takes the manifest of a batch alignment and the results file it wrote (see aligner.batch), or the output of
+manual_align for a single session with render_session() and write_index().
+
+Usage:
+    python -m aligner.report manifest.json alignments.json -o report [--workers 4] [--gesture-window 60]
+"""
+import argparse
+import html
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from aligner.batch import load_results, load_session_entry
+
+NON_STREAM_KEYS = ('warnings', 'comment', 'drift')
+
+
+def stream_offsets(alignments):
+    """
+    Offsets, in seconds, of every stream in an alignments dictionary as returned by manual_align
+
+    Streams that the batch alignment couldn't align (with a None offset) are left out.
+    """
+    return {
+        name: value.total_seconds() if isinstance(value, pd.Timedelta) else float(value)
+        for name, value in alignments.items() if name not in NON_STREAM_KEYS and value is not None
+    }
+
+
+def render_session(name, true_time_data, data_to_align, alignments, out_dir, gesture_window=60.0, width=1600,
+                   height=900):
+    """
+    Render the gesture and overview plots of every aligned stream of one session
+
+    :param name: name of the session, used as the name of its folder in out_dir
+    :param true_time_data: DataFrame (or OnDiskRecording) of the true time stream, as passed to manual_align
+    :param data_to_align: dictionary of name: DataFrame (or OnDiskRecording) of the streams, as passed to manual_align
+    :param alignments: dictionary of alignments as returned by manual_align
+    :param out_dir: directory of the report
+    :param gesture_window: width, in seconds, of the window around the gesture
+    :param width: width, in pixels, of the simulated window. The plots take up 3/4 of it, as in the GUI
+    :param height: height, in pixels, of the simulated window
+    :return: dictionary of stream name: {'gesture': path, 'overview': path}, with paths relative to out_dir
+    """
+    from aligner.headless import HeadlessAlignGUI
+
+    offsets = stream_offsets(alignments)
+    os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+    gui = HeadlessAlignGUI(true_time_data, data_to_align, width=width, height=height, blit=False)
+    try:
+        onset_times, _ = gui.true_time_data.onsets
+        images = {}
+        for stream, offset in offsets.items():
+            gui.show_alignment(stream, offset, offsets)
+            images[stream] = {'overview': save_plot(gui, out_dir, name, f'{stream}_overview.png')}
+
+            data = gui.data_to_align[stream]
+            center = gesture_center(onset_times, data.start + offset, data.end + offset)
+            gui.t_window_update(center - gesture_window / 2, center + gesture_window / 2)
+            images[stream]['gesture'] = save_plot(gui, out_dir, name, f'{stream}_gesture.png')
+    finally:
+        gui.close()
+    return images
+
+
+def gesture_center(onset_times, start, end):
+    """
+    Time to centre the gesture plot of an aligned stream on
+
+    :param onset_times: gesture candidates of the true time stream, strongest first
+    :param start: start of the aligned stream, in true time
+    :param end: end of the aligned stream, in true time
+    :return: the strongest candidate between start and end, or the middle of the stream if there is none
+    """
+    inside = onset_times[(onset_times >= start) & (onset_times <= end)]
+    return inside[0] if len(inside) else (start + end) / 2
+
+
+def save_plot(gui, out_dir, name, file_name):
+    """Save the current plot of a HeadlessAlignGUI, returning its path relative to out_dir"""
+    path = os.path.join(name, file_name)
+    gui.timeseries_figure.savefig(os.path.join(out_dir, path))
+    return path
+
+
+def render_manifest_session(session, alignments, out_dir, base_dir='.', **kwargs):
+    """Load one manifest session and render its plots. Runs in a worker process"""
+    true_time_data, data_to_align = load_session_entry(session, base_dir, workers=1)
+    return render_session(session['name'], true_time_data, data_to_align, alignments, out_dir, **kwargs)
+
+
+def render_report(sessions, results, out_dir, base_dir='.', workers=None, **kwargs):
+    """
+    Render the plots of many sessions in parallel and write the index of the report
+
+    :param sessions: list of manifest session dictionaries
+    :param results: dictionary of session name: result, as returned by aligner.batch.run_batch or load_results
+    :param out_dir: directory to write the report to
+    :param base_dir: directory relative paths in the sessions are taken from
+    :param workers: number of worker processes. Defaults to the number of CPUs
+    :param kwargs: passed on to render_session
+    :return: path of the index.html
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    images, errors = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(render_manifest_session, session, results[session['name']]['alignments'], out_dir, base_dir,
+                        **kwargs): session['name']
+            for session in sessions if 'alignments' in results.get(session['name'], {})
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                images[name] = future.result()
+            except Exception as err:
+                errors[name] = f'{type(err).__name__}: {err}'
+            print(f"{name}: {'failed' if name in errors else 'rendered'}")
+
+    for session in sessions:
+        result = results.get(session['name'], {})
+        if 'alignments' not in result:
+            errors[session['name']] = result.get('error', 'No alignments')
+    return write_index(out_dir, results, images, errors, order=[session['name'] for session in sessions])
+
+
+def write_index(out_dir, results, images, errors=None, order=None):
+    """
+    Write the index.html of a report, with every session's alignment details next to its plots
+
+    :param out_dir: directory of the report
+    :param results: dictionary of session name: result, each holding at least the 'alignments' from manual_align
+    :param images: dictionary of session name: the return value of render_session
+    :param errors: dictionary of session name: error message, for the sessions that couldn't be rendered
+    :param order: order to list the sessions in. Defaults to the order of results
+    :return: path of the index.html
+    """
+    errors = errors or {}
+    sections = []
+    for name in order or list(results):
+        result = results.get(name, {})
+        lines = [f'<h2 id="{html.escape(name)}">{html.escape(name)}</h2>']
+        if name in errors:
+            lines.append(f'<p class="error">{html.escape(errors[name])}</p>')
+        if 'alignments' in result:
+            alignments = result['alignments']
+            details = [f"source: {result.get('source', 'manual')}"]
+            if result.get('needs_review'):
+                details.append('<b>needs review</b>')
+            details += [f'{html.escape(key)}: {html.escape(value)}'
+                        for key, value in alignments.get('warnings', {}).items()]
+            if alignments.get('comment'):
+                details.append(f"comment: {html.escape(alignments['comment'])}")
+            lines.append(f"<p>{'<br>'.join(details)}</p>")
+
+            for stream, offset in stream_offsets(alignments).items():
+                summary = [f'offset {offset:.4f} s']
+                confidence = result.get('confidence', {}).get(stream)
+                if confidence is not None:
+                    summary.append(f'confidence {confidence:.2f}')
+                drift = alignments.get('drift', {}).get(stream)
+                if drift is not None:
+                    summary.append(f'drift {drift * 1e6:.1f} ppm')
+                lines.append(f"<h3>{html.escape(stream)}: {', '.join(summary)}</h3>")
+                for kind in ('gesture', 'overview'):
+                    path = images.get(name, {}).get(stream, {}).get(kind)
+                    if path is not None:
+                        src = html.escape(path.replace(os.sep, '/'))
+                        lines.append(f'<a href="{src}"><img src="{src}" alt="{kind}" loading="lazy"></a>')
+        sections.append('\n'.join(lines))
+
+    contents = '\n'.join(
+        f'<li><a href="#{html.escape(name)}">{html.escape(name)}</a>'
+        f"{' (needs review)' if results.get(name, {}).get('needs_review') else ''}</li>"
+        for name in order or list(results)
+    )
+    page = (
+        '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>Alignment report</title>\n'
+        '<style>body {font-family: sans-serif} img {width: 48%} .error {color: red}</style>\n</head>\n<body>\n'
+        f'<h1>Alignment report</h1>\n<ul>\n{contents}\n</ul>\n' + '\n'.join(sections) + '\n</body>\n</html>\n'
+    )
+    path = os.path.join(out_dir, 'index.html')
+    with open(path, 'w') as fh:
+        fh.write(page)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='JSON manifest listing the sessions that were aligned')
+    parser.add_argument('results', help='alignments file written by python -m aligner.batch')
+    parser.add_argument('-o', '--output', default='report', help='directory to write the report to')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--gesture-window', type=float, default=60.0,
+                        help='width, in seconds, of the plot around the gesture')
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as fh:
+        sessions = json.load(fh)
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+
+    index = render_report(sessions, load_results(args.results), args.output, base_dir, args.workers,
+                          gesture_window=args.gesture_window)
+    print(f'Report written to {index}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+
+from aligner.decimate import MinMaxPyramid
+from aligner.gaps import gap_index
+from aligner.onsets import envelope_level, find_onsets
+from aligner.utils import time_window
+
+
+class Stream(object):
+    """
+    A single time series, ready for plotting and alignment
+
+    Holds contiguous arrays of sample times (float64 seconds) and values along with metadata about them that would
+    otherwise be recomputed on every use. The sample times may be measured from a different start than the plot is,
+    with `offset` seconds added to them wherever they are used, so that memory-mapped times never need rewriting. The
+    decimation pyramid and gap index are on the stream's own clock, without the offset.
+    """
+
+    __slots__ = ('time', 'values', 'offset', 'start', 'end', 'median', '_pyramid', '_std', '_onsets', '_gaps')
+
+    def __init__(self, time, values, median=0.0, pyramid=None, std=None, gaps=None, offset=0.0):
+        """
+        :param time: sorted 1-D array of sample times, in seconds
+        :param values: 1-D array of sample values, same length as time
+        :param median: median that was subtracted from the values, if any
+        :param pyramid: decimation pyramid of the stream, if it was already built
+        :param std: standard deviation of the values, if it is already known
+        :param gaps: GapIndex of the stream, if it is already known
+        :param offset: seconds to add to the sample times to put them on the clock of the plot
+        """
+        self.time = np.ascontiguousarray(time, dtype=np.float64)
+        self.values = np.ascontiguousarray(values)
+        self.offset = float(offset)
+        self.start = self.time[0] + self.offset
+        self.end = self.time[-1] + self.offset
+        self.median = median
+        self._pyramid = pyramid
+        self._std = std
+        self._onsets = None
+        self._gaps = gaps
+
+    @classmethod
+    def centered(cls, time, values):
+        """Build a stream with the median removed from its values"""
+        values = np.asarray(values, dtype=np.float64)
+        median = np.nanmedian(values)
+        return cls(time, values - median, median=median)
+
+    def __len__(self):
+        return len(self.time)
+
+    @property
+    def pyramid(self):
+        """Min/max decimation pyramid of the stream, built the first time it is needed"""
+        if self._pyramid is None:
+            self._pyramid = MinMaxPyramid(self.time, self.values)
+        return self._pyramid
+
+    @property
+    def onsets(self):
+        """Candidate synchronization gestures as (times, strengths) arrays, strongest first. See find_onsets()"""
+        if self._onsets is None:
+            times, strengths = find_onsets(*envelope_level(self.pyramid))
+            self._onsets = (times + self.offset, strengths)
+        return self._onsets
+
+    @property
+    def gaps(self):
+        """Nominal sample interval, gaps and amount of missing data, as a GapIndex. See gap_index()"""
+        if self._gaps is None:
+            self._gaps = gap_index(self.time)
+        return self._gaps
+
+    @property
+    def sample_interval(self):
+        """Nominal time between consecutive samples, in seconds"""
+        return self.gaps.interval
+
+    @property
+    def plot_time(self):
+        """Sample times on the clock of the plot. The time array itself if there is no offset, otherwise a new array"""
+        return self.time + self.offset if self.offset else self.time
+
+    @property
+    def std(self):
+        """Standard deviation of the values, ignoring NaNs"""
+        if self._std is None:
+            self._std = float(np.nanstd(self.values))
+        return self._std
+
+    def window(self, t_start, t_end):
+        """
+        (time, values) of the samples with t_start < time <= t_end, on the clock of the plot
+
+        Both are zero-copy views when there is no offset. Otherwise only the times of the window are copied.
+        """
+        time, values = time_window(self.time, self.values, t_start - self.offset, t_end - self.offset)
+        return (time + self.offset if self.offset else time), values
+
+
+class LazyStreams(Mapping):
+    """
+    Read-only mapping of name: Stream that only prepares each stream the first time it is looked up
+
+    Preparation is memoized and guarded by a lock, so streams can be requested from worker threads as well.
+    """
+
+    def __init__(self, sources, prepare):
+        """
+        :param sources: dictionary of name: raw source data
+        :param prepare: function that turns one raw source into a Stream
+        """
+        self._sources = sources
+        self._prepare = prepare
+        self._ready = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        try:
+            return self._ready[name]
+        except KeyError:
+            with self._lock:
+                if name not in self._ready:
+                    self._ready[name] = self._prepare(self._sources[name])
+            return self._ready[name]
+
+    def __iter__(self):
+        return iter(self._sources)
+
+    def __len__(self):
+        return len(self._sources)
@@ -1,16 +1,135 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
 
+from aligner.cache import CSVCache
+
+
+def load_csv(file_path, time_scale_to_seconds=1.0, cache=None, dtype=None, engine=None, usecols=None):
+    """
+    Load a csv file with timestamps in the first column into a DataFrame indexed by time
+
+    :param file_path: path to the csv file
+    :param time_scale_to_seconds: number of timestamp units in one second (e.g. 1000 for timestamps in milliseconds)
+    :param cache: True to read through the default on-disk cache of parsed files, or a CSVCache instance to use
+        that cache. Repeat loads of an unchanged file then skip parsing entirely
+    :param dtype: dtype to parse every data column as (e.g. np.float32 to halve the memory use). By default the dtypes
+        are inferred
+    :param engine: csv parsing engine passed on to pd.read_csv, e.g. 'c' or 'pyarrow' (if installed)
+    :param usecols: names of the data columns to load. By default all columns are loaded
+    :return: DataFrame with a DatetimeIndex and one column per loaded data column
+    """
+    params = {
+        'time_scale_to_seconds': time_scale_to_seconds,
+        'dtype': None if dtype is None else np.dtype(dtype).str,
+        'usecols': None if usecols is None else list(usecols),
+    }
+    if cache:
+        cache = CSVCache() if cache is True else cache
+        # Computed once, since with validate='hash' that reads the whole file
+        key = cache.key(file_path, **params)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    read_kwargs = {'header': 0, 'index_col': 0}
+    if engine is not None:
+        read_kwargs['engine'] = engine
+    if dtype is not None or usecols is not None:
+        columns = pd.read_csv(file_path, header=0, nrows=0).columns
+        data_columns = list(columns[1:]) if usecols is None else list(usecols)
+        if usecols is not None:
+            read_kwargs['usecols'] = [columns[0]] + data_columns
+        if dtype is not None:
+            read_kwargs['dtype'] = {col: dtype for col in data_columns}
+
+    raw_ins = pd.read_csv(file_path, **read_kwargs)
+    raw_ins.index = epoch_to_datetime(raw_ins.index, time_scale_to_seconds)
 
-def load_csv(file_path, time_scale_to_seconds=1.0):
-    raw_ins = pd.read_csv(
-        file_path, header=0, index_col=0
-    )
-    raw_ins.index = pd.to_datetime(raw_ins.index / time_scale_to_seconds, unit='s')
+    if cache:
+        cache.put(key, raw_ins)
     return raw_ins
 
 
-def norm_df(df, column_names=None):
+def load_normed(file_path, time_scale_to_seconds=1.0, columns=None, cache=None, dtype=None):
+    """
+    Load a csv file with load_csv() and collapse its data columns into their L2 norm with norm_df()
+
+    :param columns: names of the data columns to load and norm. By default every column not including 'time'
+    :return: DataFrame with a DatetimeIndex and a single column of normed data
+    """
+    raw = load_csv(file_path, time_scale_to_seconds=time_scale_to_seconds, cache=cache, dtype=dtype, usecols=columns)
+    return norm_df(raw, column_names=None if columns is None else list(columns), dtype=dtype)
+
+
+def load_session(sources, true_time=None, workers=None, processes=False, cache=None, dtype=None):
+    """
+    Load and norm every stream of a recording session at once, ready to be passed to manual_align
+
+    Every file is parsed concurrently, so startup takes about as long as the slowest file rather than all of them:
+
+        true_time_data, data_to_align = load_session({
+            'watch': ('watch_accel.csv', 1),
+            'rcs_left': ('rcs_left_accel.csv', 1000),
+            'rcs_right': ('rcs_right_accel.csv', 1000, ['accel_x', 'accel_y', 'accel_z']),
+        })
+        manual_align(true_time_data, **data_to_align)
+
+    :param sources: dictionary of name: (path, time_scale_to_seconds, columns). time_scale_to_seconds and columns
+        can be left off the end of the tuple (defaulting to 1 and every data column), or a bare path (str or
+        os.PathLike) given instead
+    :param true_time: name of the true time stream in sources. Defaults to the first one
+    :param workers: number of files loaded at once. Defaults to one per file
+    :param processes: load in worker processes instead of threads. Parsing in threads already runs largely in
+        parallel, but processes can be faster for many large files at the cost of copying the results back
+    :param cache: passed on to load_csv for every file
+    :param dtype: passed on to load_csv and norm_df for every file
+    :return: tuple of (true_time_data, data_to_align), with data_to_align a dictionary of name: normed DataFrame
+    """
+    specs = {name: source_spec(spec) for name, spec in sources.items()}
+    true_time = next(iter(specs)) if true_time is None else true_time
+
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers or len(specs)) as pool:
+        futures = {
+            name: pool.submit(load_normed, path, scale, columns, cache=cache, dtype=dtype)
+            for name, (path, scale, columns) in specs.items()
+        }
+        loaded = {name: future.result() for name, future in futures.items()}
+
+    true_time_data = loaded.pop(true_time)
+    return true_time_data, loaded
+
+
+def source_spec(spec):
+    """Fill in the defaults of a load_session source, returning a (path, time_scale_to_seconds, columns) tuple"""
+    spec = (spec,) if isinstance(spec, (str, os.PathLike)) else tuple(spec)
+    return spec + (1.0, None)[len(spec) - 1:]
+
+
+def epoch_to_datetime(epochs, time_scale_to_seconds=1.0):
+    """
+    Convert epoch numbers to a DatetimeIndex
+
+    Integer epochs whose unit is a whole number of nanoseconds (seconds, milliseconds, microseconds...) are converted
+    by integer multiplication, which is faster and exact. Anything else goes through seconds as floats.
+
+    :param epochs: Index or array of epoch numbers
+    :param time_scale_to_seconds: number of epoch units in one second
+    :return: DatetimeIndex, keeping the name of epochs if it had one
+    """
+    name = getattr(epochs, 'name', None)
+    values = np.asarray(epochs)
+    ns_per_unit = 1e9 / time_scale_to_seconds
+    if np.issubdtype(values.dtype, np.integer) and ns_per_unit == int(ns_per_unit):
+        ns = values.astype(np.int64) * int(ns_per_unit)
+        return pd.DatetimeIndex(ns.view('datetime64[ns]'), name=name)
+    return pd.DatetimeIndex(pd.to_datetime(values / time_scale_to_seconds, unit='s'), name=name)
+
+
+def norm_df(df, column_names=None, dtype=None, chunk_size=None):
     """
     Convenience function to collapse multidimensional data into a single normed dimension
 
@@ -21,6 +140,9 @@ def norm_df(df, column_names=None):
     :param df: long-form dataframe with data to normalize. Each column is a separate axis/dimension of the data
     :param column_names: The names of columns, as a list, to include in the L2 norm. by default will pull all columns
         except those including the word 'time'
+    :param dtype: dtype to compute and return the norm in, e.g. np.float32. Defaults to float64
+    :param chunk_size: if given, compute the norm this many rows at a time, so that only one chunk of the selected
+        columns is ever copied. Useful for frames too large to copy whole
 
     :return: DataFrame with the same index as the original dataframe but with only one data column, named 'values'
     which contains the L2 normed data.
@@ -28,16 +150,75 @@ def norm_df(df, column_names=None):
 
     if column_names is None:
         column_names = col_names(df, exclude='time')
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
 
-    squared = np.array([df[col]**2 for col in column_names]).T
-    normed = np.sqrt(np.sum(squared, axis=1))
+    normed = np.empty(len(df), dtype=dtype)
+    step = len(df) if chunk_size is None else chunk_size
+    for start in range(0, len(df), max(step, 1)):
+        # A 2-D array of just the selected columns. No copy when they already share one block of this dtype
+        block = df.iloc[start:start + step][column_names].to_numpy(dtype=dtype)
+        out = normed[start:start + step]
+        np.einsum('ij,ij->i', block, block, out=out)
+        np.sqrt(out, out=out)
     return pd.DataFrame(normed, index=df.index)
 
 
-def timestamp_to_elapsed(timestamps, start=None):
-    """Convert from pandas timestamps to time, in seconds, since the start of the recording"""
-    start = start if start is not None else timestamps[0]
-    return [t.total_seconds() for t in timestamps - start]
+def timestamp_to_elapsed(timestamps, start=None, time_scale_to_seconds=1.0):
+    """
+    Convert timestamps to time, in seconds, since the start of the recording
+
+    Datetime-like and timedelta-like timestamps are handled as int64 nanoseconds, so the whole conversion is a single
+    vectorized subtraction and division. Raw epoch numbers (e.g. unix milliseconds straight out of a csv) are also
+    accepted, so there is no need to go through pd.to_datetime first.
+
+    :param timestamps: DatetimeIndex, datetime64 array/Series, TimedeltaIndex, timedelta64 array/Series, or array of
+        epoch numbers
+    :param start: time to measure from. Either a timestamp or an epoch number in the same units as the timestamps.
+        Defaults to the first timestamp
+    :param time_scale_to_seconds: only used for epoch numbers. The number of timestamp units in one second
+    :return: float64 numpy array of elapsed seconds
+    """
+    if pd.api.types.is_datetime64_any_dtype(timestamps):
+        ns = pd.DatetimeIndex(timestamps).as_unit('ns').asi8
+        start_ns = ns[0] if start is None else pd.Timestamp(start).value
+        return (ns - start_ns) / 1e9
+    if pd.api.types.is_timedelta64_dtype(timestamps):
+        ns = pd.TimedeltaIndex(timestamps).as_unit('ns').asi8
+        start_ns = ns[0] if start is None else pd.Timedelta(start).value
+        return (ns - start_ns) / 1e9
+
+    epochs = np.asarray(timestamps)
+    if start is None:
+        start = epochs[0]
+    elif isinstance(start, (pd.Timestamp, np.datetime64)):
+        start = pd.Timestamp(start).value / 1e9 * time_scale_to_seconds
+    return (epochs - start) / float(time_scale_to_seconds)
+
+
+def time_window_bounds(time, t_start, t_end):
+    """
+    Find the index range of the samples with t_start < time <= t_end using binary search
+
+    :param time: sorted 1-D array of sample times
+    :param t_start: start of the window (exclusive)
+    :param t_end: end of the window (inclusive)
+    :return: tuple (i0, i1) such that time[i0:i1] is the window
+    """
+    return int(np.searchsorted(time, t_start, side='right')), int(np.searchsorted(time, t_end, side='right'))
+
+
+def time_window(time, values, t_start, t_end):
+    """
+    Cut a time window out of a sorted time series without copying
+
+    :param time: sorted 1-D array of sample times
+    :param values: array of sample values, same length as time
+    :param t_start: start of the window (exclusive)
+    :param t_end: end of the window (inclusive)
+    :return: tuple of (time, values) views covering the window
+    """
+    i0, i1 = time_window_bounds(time, t_start, t_end)
+    return time[i0:i1], values[i0:i1]
 
 
 def col_names(df, exclude=None, include=None):
@@ -55,9 +236,9 @@ def col_names(df, exclude=None, include=None):
     if include is not None:
         # Only include columns that include the include string in their names
         reduced_names = []
-        for c in df.columns:
+        for c in names:
             try:
-                if exclude in c:
+                if include in c:
                     reduced_names.append(c)
             except TypeError:
                 pass
@@ -66,7 +247,7 @@ def col_names(df, exclude=None, include=None):
     if exclude is not None:
         # Only include columns that do not include the exclude string in their names
         reduced_names = []
-        for c in df.columns:
+        for c in names:
             try:
                 if exclude not in c:
                     reduced_names.append(c)
@@ -0,0 +1,98 @@
+"""
+Import-time budget check for the headless parts of the package
+
+Imports each module in a fresh interpreter with `python -X importtime`, and fails (exit status 1) if the time to
+import it is over its budget, or if it pulled in a GUI or plotting package. matplotlib should only be imported once a
+window or a headless canvas is actually created, and tkinter only by the GUI itself. Each module is timed several
+times and the fastest run is kept, to keep noise from other processes out of the result.
+
+The same check runs as part of the test suite, see tests/test_import_time.py.
+
+Usage:
+    python benchmarks/bench_import.py [--repeats 5] [--scale 1.0] [--verbose]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Milliseconds. Everything except the bare package is dominated by importing pandas (330-450 ms here, depending on
+# the load of the machine), and the rest of each import is well under 100 ms. The budgets leave room for that jitter,
+# but not for an import of matplotlib (about 300 ms on its own)
+BUDGETS = {
+    'aligner': 20,
+    'aligner.utils': 600,
+    'aligner.auto_align': 600,
+    'aligner.outofcore': 600,
+    'aligner.batch': 600,
+    'aligner.gui': 700,
+}
+# Packages that must not be imported, with the modules that are allowed to import them anyway
+FORBIDDEN = {'matplotlib': (), 'tkinter': ('aligner.gui',)}
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(statement):
+    """
+    Run a statement in a fresh interpreter with -X importtime
+
+    :return: tuple of (dictionary of top-level module: cumulative microseconds, every (module, cumulative microseconds)
+        pair that was imported, set of every module loaded by the end of the statement)
+    """
+    code = f'{statement}; import sys; print(",".join(sys.modules))'
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, env=env,
+                            check=True)
+    top_level, every = {}, []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        every.append((name.strip(), int(cumulative)))
+        if len(name) - len(name.lstrip()) == 1:
+            top_level[name.strip()] = int(cumulative)
+    return top_level, every, set(result.stdout.strip().split(','))
+
+
+def measure(module, baseline, repeats):
+    """Fastest total import time of a module, in milliseconds, with its breakdown and loaded modules"""
+    best = None
+    for _ in range(repeats):
+        top_level, every, loaded = import_times(f'import {module}')
+        total = sum(us for name, us in top_level.items() if name not in baseline) / 1000
+        if best is None or total < best[0]:
+            best = (total, every, loaded)
+    return best
+
+
+def forbidden_imports(module, loaded):
+    """Names of the forbidden packages among the modules loaded by importing a module"""
+    return [name for name, allowed in FORBIDDEN.items() if name in loaded and module not in allowed]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5, help='number of times each module is imported')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every budget, e.g. for slow CI machines')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show the slowest imports of every module')
+    args = parser.parse_args()
+
+    baseline = set(import_times('pass')[0])
+    failed = False
+    print(f"{'module':>20} {'ms':>8} {'budget':>8}  status")
+    for module, budget in BUDGETS.items():
+        total, every, loaded = measure(module, baseline, args.repeats)
+        budget *= args.scale
+        problems = [f'imports {name}' for name in forbidden_imports(module, loaded)]
+        if total > budget:
+            problems.append('over budget')
+        failed |= bool(problems)
+        print(f"{module:>20} {total:8.1f} {budget:8.0f}  {', '.join(problems) or 'ok'}")
+        if args.verbose or problems:
+            for name, us in sorted(every, key=lambda pair: -pair[1])[:5]:
+                print(f"{'':>22}{us / 1000:8.1f}  {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark suite on synthetic recordings, from minutes up to a full day
+
+Each case is a session generated by benchmarks/synthetic.py (a watch recording plus two RC+S recordings with known
+offsets), given as DURATION@RATE with the duration in s, m or h and the rate in Hz. Sessions are generated once into
+the data directory and reused on later runs. Every case runs in a fresh process, which measures:
+
+    load       load_csv of every file in the session (without the csv cache)
+    norm       norm_df of every file
+    prep       conversion to elapsed seconds, median removal and decimation pyramid of every stream
+    startup    creating the aligner and rendering the first stream to align
+    auto       auto_align of every stream, with the largest error against the known offsets
+    export     export_aligned of the session at the known offsets, onto the true time clock, as rows written per
+               second. To csv, and to parquet as well if pyarrow is installed
+    peak mem   peak resident memory of the process
+    latency    keypress-to-render time of each navigation key, p50/p95 over repeated presses, rendered to an
+               off-screen Agg canvas at the size of a 1600x900 window
+
+Usage:
+    python benchmarks/bench_suite.py [--cases 1m@25 10m@100 1h@250] [--presses 40] [--json results.json]
+    python benchmarks/bench_suite.py --cases 24h@500 --data-dir /scratch/aligner-bench
+"""
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import generate_session  # noqa: E402
+
+DEFAULT_CASES = ['1m@25', '10m@100', '1h@250']
+UNITS = {'s': 1, 'm': 60, 'h': 3600}
+# Key presses to simulate, as pairs of GUI methods pressed alternately so the view stays put
+KEYS = {
+    'shift': ('shift_right', 'shift_left'),
+    'fine shift': ('fine_shift_right', 'fine_shift_left'),
+    'look': ('look_right', 'look_left'),
+    'zoom': ('zoom_in', 'zoom_out'),
+    'scale': ('scale_up', 'scale_down'),
+}
+
+
+def parse_case(case):
+    """Turn a DURATION@RATE string like 10m@100 into (seconds, Hz)"""
+    duration, rate = case.split('@')
+    if duration[-1] in UNITS:
+        return float(duration[:-1]) * UNITS[duration[-1]], float(rate)
+    return float(duration), float(rate)
+
+
+def session_dir(data_dir, case):
+    """Directory holding the session of a case, generating it first if needed"""
+    path = os.path.join(data_dir, case.replace('@', '_'))
+    if not os.path.exists(os.path.join(path, 'session.json')):
+        duration, rate = parse_case(case)
+        print(f'Generating {case}...', flush=True)
+        generate_session(path, duration, rate)
+    return path
+
+
+def clock(func, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def run_case(path, presses):
+    """Benchmark one session. Runs in its own process so the peak memory is the case's alone"""
+    import matplotlib
+    matplotlib.use('Agg')
+    from aligner.auto_align import auto_align
+    from aligner.batch import file_spec
+    from aligner.export import export_aligned
+    from aligner.headless import HeadlessAlignGUI
+    from aligner.stream import Stream
+    from aligner.utils import load_csv, norm_df, timestamp_to_elapsed
+
+    with open(os.path.join(path, 'session.json')) as fh:
+        session = json.load(fh)[0]
+    files = {'true_time': file_spec(session['true_time'], path)}
+    files.update({name: file_spec(spec, path) for name, spec in session['streams'].items()})
+
+    results = {'samples': 0, 'load': 0.0, 'norm': 0.0, 'prep': 0.0}
+    normed = {}
+    for name, (file_path, scale) in files.items():
+        raw, elapsed = clock(load_csv, file_path, time_scale_to_seconds=scale)
+        results['load'] += elapsed
+        results['samples'] += len(raw)
+        normed[name], elapsed = clock(norm_df, raw)
+        results['norm'] += elapsed
+        del raw
+
+    start = normed['true_time'].index[0]
+    for df in normed.values():
+        t0 = time.perf_counter()
+        stream = Stream.centered(timestamp_to_elapsed(df.index, start), df.iloc[:, 0].to_numpy())
+        stream.pyramid
+        results['prep'] += time.perf_counter() - t0
+        del stream
+
+    true_time_data = normed.pop('true_time')
+    suggestions, results['auto'] = clock(auto_align, true_time_data, **normed)
+    results['auto error'] = max(abs(offset.total_seconds() - session['expected_offsets'][name])
+                                for name, (offset, _) in suggestions.items())
+
+    results['export'] = {}
+    formats = ['csv'] + (['parquet'] if importlib.util.find_spec('pyarrow') is not None else [])
+    with tempfile.TemporaryDirectory() as out_dir:
+        for file_format in formats:
+            rows, elapsed = clock(export_aligned, files, session['expected_offsets'],
+                                  os.path.join(out_dir, f'aligned.{file_format}'), file_format=file_format)
+            results['export'][file_format] = rows / elapsed
+
+    t0 = time.perf_counter()
+    gui = HeadlessAlignGUI(true_time_data, normed)
+    gui.next()
+    gui.zscore_rescale()
+    results['startup'] = time.perf_counter() - t0
+
+    results['latency'] = {}
+    for key, methods in KEYS.items():
+        times = []
+        for i in range(presses):
+            _, elapsed = clock(getattr(gui, methods[i % 2]))
+            times.append(elapsed)
+        results['latency'][key] = tuple(np.percentile(times, (50, 95)))
+    gui.prefetcher.shutdown(wait=False)
+
+    # ru_maxrss is in kilobytes on Linux
+    results['peak mem'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return results
+
+
+def print_results(all_results):
+    print(f"\n{'case':>10} {'samples':>11} {'load s':>8} {'norm s':>8} {'prep s':>8} {'start s':>8} {'auto s':>8} "
+          f"{'err ms':>7} {'peak MB':>8}")
+    for case, r in all_results.items():
+        print(f"{case:>10} {r['samples']:>11} {r['load']:8.2f} {r['norm']:8.2f} {r['prep']:8.2f} {r['startup']:8.2f} "
+              f"{r['auto']:8.2f} {1000 * r['auto error']:7.1f} {r['peak mem'] / 2 ** 20:8.0f}")
+
+    print(f"\n{'case':>10} " + ' '.join(f'{key + " p50/p95 ms":>22}' for key in KEYS))
+    for case, r in all_results.items():
+        cells = [f'{1000 * p50:.1f} / {1000 * p95:.1f}' for p50, p95 in r['latency'].values()]
+        print(f'{case:>10} ' + ' '.join(f'{cell:>22}' for cell in cells))
+
+    print(f"\n{'case':>10} {'export csv rows/s':>18} {'export parquet rows/s':>22}")
+    for case, r in all_results.items():
+        parquet = f"{r['export']['parquet']:.0f}" if 'parquet' in r['export'] else '-'
+        print(f"{case:>10} {r['export']['csv']:18.0f} {parquet:>22}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', default=DEFAULT_CASES, help='sessions to benchmark, as DURATION@RATE')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'aligner-bench'),
+                        help='directory the generated sessions are kept in')
+    parser.add_argument('--presses', type=int, default=40, help='number of presses of each key to time')
+    parser.add_argument('--json', default=None, help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    all_results = {}
+    context = multiprocessing.get_context('spawn')
+    for case in args.cases:
+        path = session_dir(args.data_dir, case)
+        print(f'Running {case}...', flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            all_results[case] = pool.submit(run_case, path, args.presses).result()
+
+    print_results(all_results)
+    if args.json is not None:
+        with open(args.json, 'w') as fh:
+            json.dump(all_results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
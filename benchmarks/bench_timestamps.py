@@ -0,0 +1,59 @@
+"""
+Benchmark for aligner.utils.timestamp_to_elapsed
+
+Times the vectorized conversion for DatetimeIndex input and for raw epoch milliseconds (as found in the RC+S csv
+files), from 10^4 up to 10^8 samples. The old per-element `.total_seconds()` conversion is timed alongside it for the
+smaller sizes, where it still finishes in reasonable time.
+
+Usage:
+    python benchmarks/bench_timestamps.py [--max-exp 8] [--legacy-max-exp 6]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from aligner.utils import timestamp_to_elapsed
+
+
+def legacy_timestamp_to_elapsed(timestamps, start=None):
+    start = start if start is not None else timestamps[0]
+    return [t.total_seconds() for t in timestamps - start]
+
+
+def best_of(func, repeats=3):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--min-exp', type=int, default=4, help='smallest size, as a power of 10')
+    parser.add_argument('--max-exp', type=int, default=8, help='largest size, as a power of 10')
+    parser.add_argument('--legacy-max-exp', type=int, default=6, help='largest size to time the legacy conversion at')
+    args = parser.parse_args()
+
+    print(f"{'samples':>12} {'datetime (s)':>14} {'epoch ms (s)':>14} {'legacy (s)':>12} {'ns/sample':>10}")
+    for exp in range(args.min_exp, args.max_exp + 1):
+        n = 10 ** exp
+        epoch_ms = 1637208257245 + np.arange(n, dtype=np.int64) * 4
+        index = pd.DatetimeIndex(epoch_ms * 1_000_000)
+
+        t_datetime = best_of(lambda index=index: timestamp_to_elapsed(index))
+        t_epoch = best_of(lambda epoch_ms=epoch_ms: timestamp_to_elapsed(epoch_ms, time_scale_to_seconds=1000))
+        if exp <= args.legacy_max_exp:
+            t_legacy = f'{best_of(lambda index=index: legacy_timestamp_to_elapsed(index), repeats=1):12.4f}'
+        else:
+            t_legacy = f"{'-':>12}"
+        print(f'{n:>12} {t_datetime:14.4f} {t_epoch:14.4f} {t_legacy} {1e9 * t_datetime / n:10.2f}')
+        # Free the arrays before allocating the next size, the lambdas hold them only as default arguments
+        del epoch_ms, index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Synthetic multi-stream accelerometer recordings with known offsets
+
+Generates one session of csv files in the same formats as example_data: a watch recording with epoch seconds and
+x, y, z columns as the true time stream, and two RC+S recordings with epoch milliseconds and accel_x, accel_y, accel_z
+columns whose clocks are off by a known offset. All streams see the same movement: a calibration gesture (a burst of
+sharp taps) near the start and randomly spaced movement bouts throughout, on top of gravity and sensor noise. Files
+are written in chunks so multi-hour recordings never need to fit in memory.
+
+Along with the csv files a session.json manifest is written, in the format aligner.batch reads, with the true offset
+of every stream added under "expected_offsets" (in the same convention as the alignments: stream time + offset = true
+time).
+
+Usage:
+    python benchmarks/synthetic.py out_dir [--duration 3600] [--rate 250]
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+START_EPOCH = 1637207922.79
+DEFAULT_OFFSETS = {'rcs_left': 16.237, 'rcs_right': -20.826}
+STREAM_FORMATS = {
+    'watch': {'columns': ['x', 'y', 'z'], 'gravity': (0.0, 0.0, -1.0), 'gain': 1.0, 'noise': 0.02,
+              'time_scale_to_seconds': 1},
+    'rcs': {'columns': ['accel_x', 'accel_y', 'accel_z'], 'gravity': (103.0, 10.0, 18.0), 'gain': 100.0, 'noise': 0.6,
+            'time_scale_to_seconds': 1000},
+}
+
+
+def movement_events(duration, seed=0, gesture_time=20.0, bout_spacing=30.0):
+    """
+    Draw the movement shared by every stream of a session
+
+    :return: list of (true time in seconds from the start, duration, amplitude, frequency) tuples. The first few are
+        the taps of the calibration gesture
+    """
+    rng = np.random.default_rng(seed)
+    events = [(gesture_time + 0.6 * i, 0.15, 2.0, 12.0) for i in range(3) if gesture_time + 0.6 * i < duration]
+    t = gesture_time + 5.0
+    while t < duration:
+        length = rng.uniform(1.0, 8.0)
+        events.append((t, length, rng.uniform(0.1, 0.5), rng.uniform(0.5, 4.0)))
+        t += length + rng.exponential(bout_spacing)
+    return events
+
+
+def movement(t, events):
+    """Evaluate the movement signal at true times t (sorted, seconds from the start of the session)"""
+    signal = np.zeros_like(t)
+    for start, length, amplitude, freq in events:
+        lo, hi = np.searchsorted(t, [start, start + length])
+        if lo == hi:
+            continue
+        phase = (t[lo:hi] - start) / length
+        signal[lo:hi] += amplitude * np.sin(np.pi * phase) * np.sin(2 * np.pi * freq * (t[lo:hi] - start))
+    return signal
+
+
+def write_stream(file_path, kind, duration, rate, events, offset=0.0, start_delay=0.0, seed=0, chunk_seconds=600.0):
+    """
+    Write one recording to csv, chunk by chunk
+
+    :param file_path: csv file to write
+    :param kind: 'watch' or 'rcs', setting the column names, units and timestamp format
+    :param duration: length of the session, in seconds
+    :param rate: sample rate, in Hz
+    :param events: shared movement from movement_events()
+    :param offset: the stream's clock reads true time - offset
+    :param start_delay: seconds after the start of the session that this stream starts recording
+    :param seed: seed for the sensor noise and sample jitter
+    :param chunk_seconds: seconds of data generated and written at once
+    """
+    fmt = STREAM_FORMATS[kind]
+    rng = np.random.default_rng(seed)
+    # Movement mostly along gravity, so it shows up with the same sign in the norm of every stream
+    gravity = np.asarray(fmt['gravity'])
+    direction = gravity / np.linalg.norm(gravity) + rng.normal(0, 0.3, 3)
+    direction /= np.linalg.norm(direction)
+    n_total = int((duration - start_delay) * rate)
+    chunk = max(int(chunk_seconds * rate), 1)
+
+    with open(file_path, 'w', newline='') as fh:
+        fh.write(','.join(['timestamp'] + fmt['columns']) + '\n')
+        for first in range(0, n_total, chunk):
+            n = min(chunk, n_total - first)
+            true_t = start_delay + (first + np.arange(n)) / rate + rng.normal(0, 0.05 / rate, n)
+            true_t.sort()
+            signal = movement(true_t, events)
+            columns = {}
+            for i, name in enumerate(fmt['columns']):
+                axis = fmt['gravity'][i] + fmt['gain'] * direction[i] * signal
+                columns[name] = axis + rng.normal(0, fmt['noise'], n)
+
+            stamps = START_EPOCH + true_t - offset
+            if fmt['time_scale_to_seconds'] == 1000:
+                stamps = np.round(stamps * 1000).astype(np.int64)
+            pd.DataFrame({'timestamp': stamps, **columns}).to_csv(fh, header=False, index=False, float_format='%.4f')
+
+
+def generate_session(out_dir, duration, rate, offsets=None, seed=0, true_rate=None):
+    """
+    Write a watch recording and one RC+S recording per offset, plus the session.json manifest
+
+    :param out_dir: directory to write the session into
+    :param duration: length of the session, in seconds
+    :param rate: sample rate of the RC+S streams, in Hz
+    :param offsets: dictionary of stream name: true offset in seconds. Defaults to two streams, rcs_left and rcs_right
+    :param seed: seed for the movement and noise
+    :param true_rate: sample rate of the watch. Defaults to rate
+    :return: the manifest session dictionary
+    """
+    offsets = DEFAULT_OFFSETS if offsets is None else offsets
+    true_rate = rate if true_rate is None else true_rate
+    os.makedirs(out_dir, exist_ok=True)
+    events = movement_events(duration, seed)
+
+    write_stream(os.path.join(out_dir, 'watch_accel.csv'), 'watch', duration, true_rate, events, seed=seed)
+    session = {
+        'name': f'synthetic_{duration:g}s_{rate:g}hz',
+        'true_time': {'path': 'watch_accel.csv', 'time_scale_to_seconds': 1},
+        'streams': {},
+        'expected_offsets': dict(offsets),
+    }
+    for i, (name, offset) in enumerate(offsets.items()):
+        file_name = f'{name}_accel.csv'
+        write_stream(os.path.join(out_dir, file_name), 'rcs', duration, rate, events, offset=offset,
+                     start_delay=min(5.0 * (i + 1), duration / 10), seed=seed + i + 1)
+        session['streams'][name] = {'path': file_name, 'time_scale_to_seconds': 1000}
+
+    with open(os.path.join(out_dir, 'session.json'), 'w') as fh:
+        json.dump([session], fh, indent=2)
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('out_dir', help='directory to write the session into')
+    parser.add_argument('-d', '--duration', type=float, default=3600, help='length of the recording, in seconds')
+    parser.add_argument('-r', '--rate', type=float, default=250, help='sample rate, in Hz')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_session(args.out_dir, args.duration, args.rate, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
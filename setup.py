@@ -18,4 +18,9 @@ setup(
     license_files='LICENSE',
     packages=find_packages(),
     install_requires=['numpy', 'pandas', 'matplotlib', 'gitpython'],
+    extras_require={'parquet': ['pyarrow']},
+    entry_points={
+        'console_scripts': ['aligner-batch=aligner.batch:main', 'aligner-report=aligner.report:main',
+                            'aligner-export=aligner.export:main'],
+    },
 )
\ No newline at end of file
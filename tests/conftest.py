@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+START_MS = 1637207911000
+
+
+@pytest.fixture
+def start_ms():
+    """Epoch millisecond timestamp write_accel_csv starts its files at by default"""
+    return START_MS
+
+
+@pytest.fixture
+def write_accel_csv(tmp_path):
+    """
+    Factory writing 3-axis accelerometer csv files with epoch millisecond timestamps into tmp_path
+
+    Values are rounded to 2 decimals, so that some of them repeat. Call as
+    write_accel_csv(name, duration, rate, start_ms=START_MS, seed=0, drop=None, nan_fraction=0.0), with drop an
+    optional (t0, t1) range of seconds whose samples are left out, and nan_fraction the share of rows set to NaN.
+    Returns the path of the file as a string.
+    """
+    def write(name, duration, rate, start_ms=START_MS, seed=0, drop=None, nan_fraction=0.0):
+        rng = np.random.default_rng(seed)
+        elapsed = np.arange(int(round(duration * rate))) / rate
+        if drop is not None:
+            elapsed = elapsed[(elapsed < drop[0]) | (elapsed >= drop[1])]
+        data = rng.normal(size=(len(elapsed), 3)).round(2)
+        data[rng.choice(len(elapsed), int(nan_fraction * len(elapsed)), replace=False)] = np.nan
+        frame = pd.DataFrame(data, columns=['accel_x', 'accel_y', 'accel_z'])
+        frame.insert(0, 'timestamp', start_ms + np.round(elapsed * 1000).astype(np.int64))
+        path = tmp_path / name
+        frame.to_csv(path, index=False)
+        return str(path)
+    return write
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aligner.auto_align import DRIFT_RESIDUAL_THRESHOLD, auto_align, estimate_drift, estimate_lag
+
+DURATION = 7200.0
+
+
+def movement(duration, seed=0, active=None):
+    """
+    Fine-grained synthetic movement signal: random bumps of energy
+
+    :param active: optional list of (start, end) times, in seconds, outside of which there is no movement
+    :return: function evaluating the signal at any times
+    """
+    rng = np.random.default_rng(seed)
+    grid = np.arange(0, duration + 60, 0.005)
+    centers = rng.uniform(0, grid[-1], int(grid[-1] / 4))
+    if active is not None:
+        centers = centers[np.any([(centers > a) & (centers < b) for a, b in active], axis=0)]
+    signal = np.zeros(len(grid))
+    for center, width, amplitude in zip(centers, rng.uniform(0.1, 1.0, len(centers)),
+                                        rng.uniform(0.2, 2.0, len(centers))):
+        near = slice(*np.searchsorted(grid, [center - 4 * width, center + 4 * width]))
+        signal[near] += amplitude * np.exp(-0.5 * ((grid[near] - center) / width) ** 2)
+    return lambda t: np.interp(t, grid, signal)
+
+
+def recordings(offset_at, rate=50.0, seed=0, **kwargs):
+    """
+    A reference recording at 25 Hz and a recording of the same movement whose clock is off by offset_at(true time)
+
+    Each recording has its own sensor noise, and the second one starts off the 25 Hz grid as real recordings do.
+
+    :return: tuple of (ref_time, ref_values, time, values), times in seconds on each recording's own clock
+    """
+    signal = movement(DURATION, seed=seed, **kwargs)
+    rng = np.random.default_rng(seed + 1)
+    ref_time = np.arange(0, DURATION, 1 / 25)
+    true_time = np.arange(30.0137, DURATION - 30, 1 / rate)
+    return (ref_time, signal(ref_time) + 0.02 * rng.normal(size=len(ref_time)),
+            true_time - offset_at(true_time), signal(true_time) + 0.02 * rng.normal(size=len(true_time)))
+
+
+def test_auto_align_recovers_a_known_offset():
+    offset = 17.3
+    signal = movement(600.0, seed=3)
+    rng = np.random.default_rng(4)
+    start = pd.Timestamp('2021-11-18 04:38:31')
+    ref_time = np.arange(0, 600, 1 / 25)
+    time = np.arange(40.0137, 560, 1 / 50)
+    true_time = pd.DataFrame(signal(ref_time) + 0.02 * rng.normal(size=len(ref_time)),
+                             index=start + pd.to_timedelta(ref_time, unit='s'))
+    shifted = pd.DataFrame(signal(time) + 0.02 * rng.normal(size=len(time)),
+                           index=start + pd.to_timedelta(time - offset, unit='s'))
+
+    estimate, confidence = auto_align(true_time, watch=shifted)['watch']
+    # Within half a step of the 25 Hz grid the streams are correlated on
+    assert estimate.total_seconds() == pytest.approx(offset, abs=0.02)
+    assert confidence > 0.5
+
+
+def test_noise_gives_low_confidence():
+    rng = np.random.default_rng(5)
+    ref_time, time = np.arange(0, 600, 1 / 25), np.arange(20, 580, 1 / 50)
+    _, confidence = estimate_lag(ref_time, rng.normal(size=len(ref_time)), time, rng.normal(size=len(time)))
+    assert confidence < 0.1
+
+
+def test_recovers_linear_drift():
+    offset, drift = 12.5, 50e-6
+    estimate = estimate_drift(*recordings(lambda t: offset + drift * t), offset)
+
+    assert estimate['drift'] == pytest.approx(drift, abs=2e-6)
+    assert estimate['offset'] == pytest.approx(offset, abs=0.01)
+    assert estimate['residual'] < DRIFT_RESIDUAL_THRESHOLD
+
+
+@pytest.mark.parametrize('step_at', [0.5, 0.8])
+def test_step_shift_shows_in_the_residual(step_at):
+    offset = 12.5
+    estimate = estimate_drift(*recordings(lambda t: offset + 0.5 * (t > step_at * DURATION)), offset)
+
+    assert estimate['residual'] > DRIFT_RESIDUAL_THRESHOLD
+
+
+def test_too_few_windows_is_no_estimate():
+    # Movement in only two of the windows, which a line always fits exactly
+    offset = 12.5
+    data = recordings(lambda t: offset + 1e-4 * t, active=[(1000, 1040), (5000, 5040)])
+    assert estimate_drift(*data, offset, step=60.0) is None
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from aligner.batch import align_session, load_results, run_batch, save_results
+
+
+@pytest.fixture
+def session(tmp_path, write_accel_csv):
+    """A session with a copy of the true time stream 4 s late, and a flat stream that can't be aligned"""
+    watch = write_accel_csv('watch.csv', 120, 50)
+    frame = pd.read_csv(watch)
+    late = frame.assign(timestamp=frame['timestamp'] + 4000)
+    late.to_csv(tmp_path / 'late.csv', index=False)
+    frame.assign(accel_x=0.0, accel_y=0.0, accel_z=0.0).to_csv(tmp_path / 'flat.csv', index=False)
+    return {
+        'name': 'subject01_day1',
+        'true_time': {'path': 'watch.csv', 'time_scale_to_seconds': 1000},
+        'streams': {
+            'late': {'path': 'late.csv', 'time_scale_to_seconds': 1000},
+            'flat': {'path': 'flat.csv', 'time_scale_to_seconds': 1000},
+        },
+    }
+
+
+def test_stream_that_cannot_be_aligned_is_sent_to_review(tmp_path, session):
+    result = align_session(session, str(tmp_path))
+
+    assert result['alignments']['late'].total_seconds() == pytest.approx(-4.0, abs=0.01)
+    assert result['confidence']['late'] > 0.5
+    assert result['alignments']['flat'] is None
+    assert result['confidence']['flat'] == 0.0
+    assert result['alignments']['drift']['flat'] is None
+    assert result['needs_review']
+    assert 'auto alignment warning' in result['alignments']['warnings']
+
+
+def test_search_window_excluding_every_offset_is_sent_to_review(tmp_path, session):
+    del session['streams']['flat']
+    result = align_session(session, str(tmp_path), search_window=(1000.0, 1001.0))
+
+    assert result['alignments']['late'] is None
+    assert result['needs_review']
+
+
+def test_run_batch_only_fails_sessions_that_do_not_load(tmp_path, session):
+    missing = dict(session, name='subject02_day1', true_time='missing.csv')
+    results = run_batch([session, missing], str(tmp_path), workers=2)
+
+    assert 'error' not in results['subject01_day1']
+    assert results['subject01_day1']['alignments']['late'].total_seconds() == pytest.approx(-4.0, abs=0.01)
+    assert results['subject02_day1']['error'].startswith('FileNotFoundError')
+    assert results['subject02_day1']['needs_review']
+
+
+def test_results_round_trip(tmp_path, session):
+    results = {session['name']: align_session(session, str(tmp_path))}
+    save_results(results, str(tmp_path / 'alignments.json'))
+
+    assert load_results(str(tmp_path / 'alignments.json')) == results
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import aligner.utils
+from aligner.cache import CSVCache
+from aligner.utils import load_csv
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Count the calls of pd.read_csv made by load_csv"""
+    calls = []
+    read_csv = pd.read_csv
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return read_csv(*args, **kwargs)
+
+    monkeypatch.setattr(aligner.utils.pd, 'read_csv', counted)
+    return calls
+
+
+def rewrite(path, digit):
+    """Replace every 1 in the data columns of a csv with another digit, keeping its size and modification time"""
+    stat = os.stat(path)
+    with open(path) as fh:
+        header, *rows = fh.read().splitlines()
+    rows = [row.partition(',')[0] + ',' + row.partition(',')[2].replace('1', str(digit)) for row in rows]
+    with open(path, 'w') as fh:
+        fh.write('\n'.join([header, *rows]) + '\n')
+    assert os.stat(path).st_size == stat.st_size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_unchanged_file_is_read_from_the_cache(tmp_path, write_accel_csv, parses):
+    path = write_accel_csv('rec.csv', 60, 50)
+    cache = CSVCache(str(tmp_path / 'cache'))
+    first = load_csv(path, time_scale_to_seconds=1000, cache=cache)
+    second = load_csv(path, time_scale_to_seconds=1000, cache=cache)
+
+    assert len(parses) == 1
+    pd.testing.assert_frame_equal(second, first, check_index_type=False, check_freq=False)
+
+
+def test_touched_file_is_parsed_again(tmp_path, write_accel_csv, parses):
+    path = write_accel_csv('rec.csv', 60, 50)
+    cache = CSVCache(str(tmp_path / 'cache'))
+    load_csv(path, time_scale_to_seconds=1000, cache=cache)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    load_csv(path, time_scale_to_seconds=1000, cache=cache)
+
+    assert len(parses) == 2
+
+
+def test_hash_validation_sees_changes_that_keep_size_and_mtime(tmp_path, write_accel_csv, parses):
+    path = write_accel_csv('rec.csv', 60, 50)
+    stat_cache = CSVCache(str(tmp_path / 'stat'))
+    hash_cache = CSVCache(str(tmp_path / 'hash'), validate='hash')
+    original = load_csv(path, time_scale_to_seconds=1000, cache=stat_cache)
+    load_csv(path, time_scale_to_seconds=1000, cache=hash_cache)
+    rewrite(path, 7)
+
+    # Only the hash notices the rewrite
+    np.testing.assert_array_equal(load_csv(path, time_scale_to_seconds=1000, cache=stat_cache), original)
+    reloaded = load_csv(path, time_scale_to_seconds=1000, cache=hash_cache)
+    assert len(parses) == 3
+    assert not np.array_equal(reloaded, original, equal_nan=True)
+
+
+def test_a_miss_hashes_the_file_once(tmp_path, write_accel_csv, monkeypatch):
+    path = write_accel_csv('rec.csv', 60, 50)
+    cache = CSVCache(str(tmp_path / 'cache'), validate='hash')
+    keys = []
+    key = cache.key
+    monkeypatch.setattr(cache, 'key', lambda *args, **kwargs: keys.append(args) or key(*args, **kwargs))
+    load_csv(path, time_scale_to_seconds=1000, cache=cache)
+
+    assert len(keys) == 1
+
+
+def test_eviction_drops_the_least_recently_used_entries(tmp_path, write_accel_csv):
+    paths = [write_accel_csv(f'rec_{i}.csv', 60, 50, seed=i) for i in range(4)]
+    cache = CSVCache(str(tmp_path / 'cache'), max_bytes=2 ** 40)
+    for path in paths[:3]:
+        load_csv(path, time_scale_to_seconds=1000, cache=cache)
+    entry_size = max(size for _, size, _ in cache.entries())
+    # Give the entries distinct last used times, oldest first, then use the oldest one again
+    for i, (_, _, entry) in enumerate(sorted(cache.entries())):
+        os.utime(entry, (1000 + i, 1000 + i))
+    first = cache.key(paths[0], time_scale_to_seconds=1000, dtype=None, usecols=None)
+    cache.get(first)
+
+    cache.max_bytes = int(2.5 * entry_size)
+    load_csv(paths[3], time_scale_to_seconds=1000, cache=cache)
+
+    remaining = {entry for _, _, entry in cache.entries()}
+    assert sum(size for _, size, _ in cache.entries()) <= cache.max_bytes
+    assert len(remaining) == 2
+    assert cache.entry_dir(first) in remaining
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from aligner.decimate import MinMaxPyramid
+
+
+@pytest.mark.parametrize('n', [8000, 12345])
+def test_every_level_keeps_the_min_and_max_of_each_bucket(n):
+    rng = np.random.default_rng(n)
+    time = np.cumsum(rng.uniform(0.001, 0.01, n))
+    values = rng.normal(size=n)
+    values[rng.choice(n, n // 50, replace=False)] = np.nan
+    values[:64] = np.nan
+
+    pyramid = MinMaxPyramid(time, values, factor=4, min_points=200)
+    assert len(pyramid) > 2
+    for (level_time, level_values), bucket_size in zip(pyramid.levels[1:], pyramid.bucket_sizes[1:]):
+        n_buckets = -(-n // bucket_size)
+        assert len(level_values) == 2 * n_buckets
+        assert np.all(np.diff(level_time) >= 0)
+        for i in range(n_buckets):
+            bucket = values[i * bucket_size:(i + 1) * bucket_size]
+            pair = level_values[2 * i:2 * i + 2]
+            if np.isnan(bucket).all():
+                assert np.isnan(pair).all()
+                continue
+            assert sorted(pair) == [np.nanmin(bucket), np.nanmax(bucket)]
+            # The extremes keep the times they occurred at
+            for value, t in zip(pair, level_time[2 * i:2 * i + 2]):
+                assert value in bucket[time[i * bucket_size:(i + 1) * bucket_size] == t]
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import aligner.export
+from aligner.export import export_aligned
+from aligner.utils import load_csv
+
+
+def merge_reference(sources, offsets):
+    """The same export done in one go, in memory, with pd.merge_asof"""
+    names = list(sources)
+    true_time = load_csv(sources[names[0]][0], time_scale_to_seconds=sources[names[0]][1])
+    merged = true_time.add_prefix(f'{names[0]}_')
+    for name in names[1:]:
+        data = load_csv(sources[name][0], time_scale_to_seconds=sources[name][1])
+        data.index = data.index + pd.Timedelta(seconds=offsets.get(name, 0.0))
+        tolerance = pd.Timedelta(int(np.median(np.diff(data.index.asi8))), unit='ns')
+        merged = pd.merge_asof(merged, data.add_prefix(f'{name}_'), left_index=True, right_index=True,
+                               direction='nearest', tolerance=tolerance)
+    return merged
+
+
+@pytest.fixture
+def session(write_accel_csv, start_ms):
+    return {
+        'watch': (write_accel_csv('watch.csv', 300, 50, seed=1), 1000),
+        'rcs_left': (write_accel_csv('left.csv', 280, 64, start_ms=start_ms + 7000, seed=2, drop=(100, 130)), 1000),
+        'rcs_right': (write_accel_csv('right.csv', 330, 100, start_ms=start_ms - 20000, seed=3), 1000),
+    }
+
+
+@pytest.mark.parametrize('chunk_size', [997, 4096, 2 ** 18])
+def test_chunked_export_matches_merge_asof(tmp_path, session, chunk_size):
+    offsets = {'rcs_left': 3.217, 'rcs_right': -1.5}
+    out_path = str(tmp_path / 'aligned.csv')
+    rows = export_aligned(session, offsets, out_path, chunk_size=chunk_size)
+
+    exported = pd.read_csv(out_path, index_col=0)
+    expected = merge_reference(session, offsets)
+    assert rows == len(expected)
+    np.testing.assert_array_equal(exported.index.to_numpy(), expected.index.asi8)
+    assert list(exported.columns) == list(expected.columns)
+    np.testing.assert_array_equal(exported.to_numpy(), expected.to_numpy())
+
+
+def test_buffer_stays_bounded_when_a_stream_leads_the_clock(tmp_path, monkeypatch, write_accel_csv, start_ms):
+    cursors = []
+
+    class RecordingCursor(aligner.export.StreamCursor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            cursors.append(self)
+
+    monkeypatch.setattr(aligner.export, 'StreamCursor', RecordingCursor)
+    chunk_size = 2000
+    sources = {
+        'watch': (write_accel_csv('watch.csv', 600, 25), 1000),
+        # Starts two hours before the true time stream
+        'early': (write_accel_csv('early.csv', 7800, 20, start_ms=start_ms - 7200 * 1000), 1000),
+    }
+    export_aligned(sources, {}, str(tmp_path / 'aligned.csv'), chunk_size=chunk_size)
+
+    early = cursors[1]
+    assert early.exhausted
+    # The lead-in alone is 144000 samples. Only the samples covering one clock chunk (chunk_size ticks at 25 Hz, so
+    # 80 s at 20 Hz) are held, plus the partial chunks on either side of them
+    assert early.max_buffered <= chunk_size / 25 * 20 + 2 * chunk_size + 1
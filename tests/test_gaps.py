@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from aligner.decimate import MinMaxPyramid
+from aligner.gaps import break_gaps, gap_index
+
+# 100 Hz for 10 s, with samples 200-249 (1.99 s to 2.5 s) and 700-899 (6.99 s to 9.0 s) lost
+TIME = np.delete(np.arange(1000) * 0.01, np.r_[200:250, 700:900])
+
+
+@pytest.mark.parametrize('chunk_size', [97, 10000])
+def test_gap_index_finds_every_dropout(chunk_size):
+    gaps = gap_index(TIME, chunk_size=chunk_size)
+
+    assert gaps.interval == pytest.approx(0.01)
+    np.testing.assert_allclose(gaps.gaps, [[1.99, 2.5], [6.99, 9.0]])
+    assert (gaps.missing, gaps.count) == (250, 750)
+    assert gaps.percent_missing == pytest.approx(25.0)
+    np.testing.assert_allclose(gaps.longer_than(1.0), [[6.99, 9.0]])
+
+
+def test_gap_index_of_bursts_after_a_dropout():
+    # The 5 samples lost in the dropout (1.0 s to 1.4 s) are delivered late, squeezed in with the one due at 1.5 s
+    time = np.concatenate([np.arange(0, 1, 0.1), 1.5 + np.arange(6) * 0.015, np.arange(1.6, 3, 0.1)])
+    gaps = gap_index(time)
+
+    assert gaps.interval == pytest.approx(0.1)
+    np.testing.assert_allclose(gaps.gaps, [[0.9, 1.5]])
+    assert gaps.missing == 0
+
+
+def test_break_gaps_inserts_one_nan_per_gap():
+    values = np.sin(TIME)
+    time, level_values = MinMaxPyramid(TIME, values, factor=4, min_points=100).levels[1]
+    gaps = gap_index(TIME)
+
+    broken_time, broken_values = break_gaps(time, level_values, gaps.gaps)
+    nan = np.flatnonzero(np.isnan(broken_values))
+    assert len(broken_time) == len(time) + 2
+    assert len(nan) == 2
+    # Each break sits at the first decimated sample after its gap
+    assert np.all(broken_time[nan - 1] <= [1.99, 6.99])
+    assert np.all((broken_time[nan] >= [2.5, 9.0]) & (broken_time[nan] == broken_time[nan + 1]))
+    np.testing.assert_array_equal(broken_values[~np.isnan(broken_values)], level_values)
+
+
+def test_break_gaps_leaves_a_window_without_gaps_alone():
+    time, values = TIME[300:600], np.sin(TIME[300:600])
+    broken_time, broken_values = break_gaps(time, values, gap_index(TIME).gaps)
+    assert broken_time is time and broken_values is values
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aligner.headless import HeadlessAlignGUI
+
+
+@pytest.fixture
+def gui():
+    index = pd.date_range('2021-11-18 04:38:31', periods=30000, freq='20ms')
+    values = np.random.default_rng(0).normal(size=len(index))
+    true_time = pd.DataFrame({'norm': values}, index=index)
+    other = pd.DataFrame({'norm': values}, index=index + pd.Timedelta(seconds=3))
+    gui = HeadlessAlignGUI(true_time, {'watch': other})
+    gui.next()
+    yield gui
+    gui.close()
+
+
+def test_held_keys_are_drawn_once(gui, monkeypatch):
+    redraws = []
+    update_canvas = gui.update_canvas
+
+    def counted(*args, **kwargs):
+        redraws.append(kwargs)
+        return update_canvas(*args, **kwargs)
+
+    monkeypatch.setattr(gui, 'update_canvas', counted)
+    # As in the GUI, where bind_keys() turns coalescing on
+    gui.coalesce_keys = True
+    start, end = gui.view_window
+    width = end - start
+
+    gui.shift_right()
+    gui.look_right()
+    gui.shift_right()
+    gui.zoom_in()
+    gui.shift_right()
+    assert redraws == []
+    assert gui.align_offset.get() == 0.0
+
+    gui.window.update()
+    assert len(redraws) == 1
+    assert gui.align_offset.get() == pytest.approx(2 * width / 30 + width / 2 / 30, abs=1e-4)
+    assert (gui.t_window_start.get(), gui.t_window_end.get()) == pytest.approx((start + width / 2, end))
+    assert gui.line_sources[gui.aligning_ts]['t_offset'] == gui.align_offset.get()
+
+
+def test_flat_stream_can_be_shown():
+    index = pd.date_range('2021-11-18 04:38:31', periods=3000, freq='20ms')
+    true_time = pd.DataFrame({'norm': np.random.default_rng(0).normal(size=len(index))}, index=index)
+    flat = pd.DataFrame({'norm': np.full(len(index), 1.7)}, index=index)
+    gui = HeadlessAlignGUI(true_time, {'flat': flat})
+    try:
+        gui.next()
+        gui.zscore_rescale()
+        assert gui.zscore_scales['flat'] == 1.0
+        assert gui.current_scale.get() == 1.0
+    finally:
+        gui.close()
+
+
+def test_missing_data_sets_the_flag_once():
+    index = pd.date_range('2021-11-18 04:38:31', periods=5000, freq='20ms')
+    values = np.random.default_rng(0).normal(size=len(index))
+    true_time = pd.DataFrame({'norm': values}, index=index)
+    # A fifth of the samples lost in one dropout
+    keep = np.r_[0:2000, 3000:5000]
+    gappy = pd.DataFrame({'norm': values[keep]}, index=index[keep])
+    gui = HeadlessAlignGUI(true_time, {'gappy': gappy, 'complete': true_time}, missing_threshold=5.0)
+    try:
+        gui.next()
+        assert gui.data_missing_flag.get()
+        assert gui.status.get() == '20.0% of gappy is missing (1 gaps), data missing flag set'
+
+        # Cleared by the user, it stays cleared when coming back to the stream
+        gui.data_warn()
+        gui.next()
+        gui.prev()
+        assert gui.currently_aligning.get() == 'gappy'
+        assert not gui.data_missing_flag.get()
+    finally:
+        gui.close()
+
+
+def test_fine_shift_is_one_nominal_sample():
+    index = pd.date_range('2021-11-18 04:38:31', periods=5000, freq='20ms')
+    values = np.random.default_rng(0).normal(size=len(index))
+    # A dropout in the first 100 samples doesn't change the sample interval
+    keep = np.r_[0:10, 60:5000]
+    stream = pd.DataFrame({'norm': values[keep]}, index=index[keep])
+    gui = HeadlessAlignGUI(pd.DataFrame({'norm': values}, index=index), {'watch': stream})
+    try:
+        gui.next()
+        assert gui.fine_shift_amt() == pytest.approx(0.02)
+        gui.fine_shift_right()
+        assert gui.align_offset.get() == pytest.approx(0.02)
+    finally:
+        gui.close()
+
+
+def test_gesture_candidates_include_the_aligning_stream():
+    index = pd.date_range('2021-11-18 04:38:31', periods=30000, freq='20ms')
+    rng = np.random.default_rng(0)
+    true_values, other_values = rng.normal(size=(2, len(index)))
+    true_values[1000:1025] *= 10
+    # Only in the stream being aligned, 400 s into it
+    other_values[20000:20025] *= 20
+    gui = HeadlessAlignGUI(pd.DataFrame({'norm': true_values}, index=index),
+                           {'watch': pd.DataFrame({'norm': other_values}, index=index)})
+    try:
+        gui.next()
+        gui.update_alignment(5.0)
+        gui.next_onset()
+        assert 'in watch' in gui.status.get()
+        assert (gui.t_window_start.get() + gui.t_window_end.get()) / 2 == pytest.approx(405.0, abs=0.5)
+
+        gui.next_onset()
+        assert 'in True Time' in gui.status.get()
+        assert (gui.t_window_start.get() + gui.t_window_end.get()) / 2 == pytest.approx(20.0, abs=0.5)
+    finally:
+        gui.close()
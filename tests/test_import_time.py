@@ -0,0 +1,25 @@
+import importlib.util
+import os
+
+import pytest
+
+BENCH_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'bench_import.py')
+spec = importlib.util.spec_from_file_location('bench_import', BENCH_PATH)
+bench_import = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench_import)
+
+# Multiplies every budget, e.g. for slow CI machines
+BUDGET_SCALE = float(os.environ.get('ALIGNER_IMPORT_BUDGET_SCALE', 1.0))
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    """Modules every fresh interpreter imports anyway, left out of the totals"""
+    return set(bench_import.import_times('pass')[0])
+
+
+@pytest.mark.parametrize('module', list(bench_import.BUDGETS))
+def test_import_stays_in_budget(module, baseline):
+    total, _, loaded = bench_import.measure(module, baseline, repeats=3)
+    assert not bench_import.forbidden_imports(module, loaded)
+    assert total <= bench_import.BUDGETS[module] * BUDGET_SCALE
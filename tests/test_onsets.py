@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from aligner.onsets import find_onsets
+
+
+@pytest.mark.parametrize('time', [[], [5.0], [5.0, 5.0, 5.0]])
+def test_no_onsets_without_a_time_span(time):
+    times, strengths = find_onsets(np.asarray(time), np.ones(len(time)))
+    assert len(times) == 0 and len(strengths) == 0
+
+
+def test_strongest_burst_comes_first():
+    time = np.arange(0, 600, 0.02)
+    values = 0.05 * np.random.default_rng(0).normal(size=len(time))
+    values[(time > 100) & (time < 101)] += 2.0
+    values[(time > 400) & (time < 401)] += 4.0
+
+    times, strengths = find_onsets(time, values)
+    assert times[0] == pytest.approx(400.5, abs=0.5)
+    assert times[1] == pytest.approx(100.5, abs=0.5)
+    assert strengths[0] > strengths[1] > 1
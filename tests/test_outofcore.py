@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aligner.decimate import MinMaxPyramid
+from aligner.outofcore import center, chunked_median, ingest_csv, write_pyramid
+from aligner.utils import load_csv, norm_df
+
+CHUNK_SIZE = 10007
+
+
+@pytest.mark.parametrize('n', [1, 2, 50001, 50002])
+def test_chunked_median_matches_numpy(n):
+    values = np.random.default_rng(n).normal(size=n).round(3)
+    values[3::7] = np.nan
+    finite = values[np.isfinite(values)]
+    median = chunked_median(values, len(finite), (finite.min(), finite.max()), chunk_size=997, bins=64)
+    assert median == np.median(finite)
+
+
+def test_chunked_median_of_constant_values():
+    assert chunked_median(np.full(30000, 2.5), 30000, (2.5, 2.5), chunk_size=997) == 2.5
+
+
+def test_ingest_matches_in_memory_norm(tmp_path, write_accel_csv):
+    path = write_accel_csv('rec.csv', 60001 / 250, 250, nan_fraction=0.01)
+    recording = ingest_csv(path, out_dir=str(tmp_path / 'rec'), time_scale_to_seconds=1000, chunk_size=CHUNK_SIZE)
+
+    normed = norm_df(load_csv(path, time_scale_to_seconds=1000)).to_numpy()[:, 0]
+    median = np.nanmedian(normed)
+    stream = recording.stream()
+    assert stream.median == median
+    np.testing.assert_allclose(np.asarray(stream.values), normed - median, equal_nan=True)
+    assert stream.std == pytest.approx(np.nanstd(normed - median))
+
+
+def test_ingest_stores_the_gap_index(tmp_path, write_accel_csv):
+    path = write_accel_csv('rec.csv', 60001 / 250, 250, drop=(4.0, 6.0))
+    recording = ingest_csv(path, out_dir=str(tmp_path / 'rec'), time_scale_to_seconds=1000, chunk_size=CHUNK_SIZE)
+
+    # Read from meta.json, not from the time array
+    assert 'gaps' in recording.meta
+    stored = recording.stream().gaps
+    assert stored.interval == pytest.approx(0.004)
+    np.testing.assert_allclose(stored.gaps, [[3.996, 6.0]])
+    assert (stored.missing, stored.count) == (500, 59501)
+
+
+def test_later_start_offsets_the_stream_without_copying(tmp_path, write_accel_csv):
+    path = write_accel_csv('rec.csv', 60001 / 250, 250)
+    out_dir = tmp_path / 'rec'
+    recording = ingest_csv(path, out_dir=str(out_dir), time_scale_to_seconds=1000, chunk_size=CHUNK_SIZE)
+    files = sorted(p.name for p in out_dir.iterdir())
+
+    own = recording.stream()
+    stream = recording.stream(recording.start - pd.Timedelta(seconds=7.5))
+    assert sorted(p.name for p in out_dir.iterdir()) == files
+    assert not stream.time.flags.owndata
+    assert stream.offset == 7.5
+    assert (stream.start, stream.end) == (own.start + 7.5, own.end + 7.5)
+
+    time, values = stream.window(100.0, 110.0)
+    own_time, own_values = own.window(92.5, 102.5)
+    np.testing.assert_array_equal(time, own_time + 7.5)
+    np.testing.assert_array_equal(values, own_values)
+
+
+def test_center_returns_std():
+    values = np.random.default_rng(1).normal(3.0, 2.0, size=25000)
+    expected = values - 1.5
+    std = center(values, 1.5, chunk_size=CHUNK_SIZE)
+    np.testing.assert_array_equal(values, expected)
+    assert std == pytest.approx(np.std(expected))
+
+
+@pytest.mark.parametrize('n', [CHUNK_SIZE * 4 - 1, CHUNK_SIZE * 4, 123457])
+def test_write_pyramid_matches_in_memory_pyramid(tmp_path, n):
+    rng = np.random.default_rng(n)
+    time = np.cumsum(rng.uniform(0.001, 0.01, n))
+    values = rng.normal(size=n)
+    values[rng.choice(n, n // 50, replace=False)] = np.nan
+
+    points = write_pyramid(time, values, str(tmp_path), factor=4, min_points=200, chunk_size=CHUNK_SIZE)
+    expected = MinMaxPyramid(time, values, factor=4, min_points=200).levels
+    assert points == [len(level_time) for level_time, _ in expected]
+    for level, (level_time, level_values) in enumerate(expected[1:], start=1):
+        np.testing.assert_array_equal(np.fromfile(tmp_path / f'time_{level}.bin'), level_time)
+        np.testing.assert_array_equal(np.fromfile(tmp_path / f'values_{level}.bin'), level_values)
@@ -0,0 +1,23 @@
+from aligner.perf import PerfRecorder
+
+
+def record_events(perf, n):
+    for _ in range(n):
+        with perf.event('t_window_update'):
+            with perf.phase('draw'):
+                pass
+
+
+def test_history_is_bounded_without_a_trace():
+    perf = PerfRecorder(enabled=True, history=50)
+    record_events(perf, 500)
+    assert perf.trace == []
+    assert len(perf.history['t_window_update']) == 50
+    assert perf.percentiles('t_window_update') is not None
+
+
+def test_trace_keeps_every_event():
+    perf = PerfRecorder(enabled=True, history=50, keep_trace=True)
+    record_events(perf, 500)
+    assert len(perf.trace) == 500
+    assert set(perf.trace[0]['phases']) == {'draw'}
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+import aligner.report
+from aligner.report import render_session
+
+
+def test_gesture_window_covers_the_aligned_stream(tmp_path, monkeypatch):
+    windows = {}
+    save_plot = aligner.report.save_plot
+
+    def recorded(gui, out_dir, name, file_name):
+        windows[file_name] = (gui.t_window_start.get(), gui.t_window_end.get())
+        return save_plot(gui, out_dir, name, file_name)
+
+    monkeypatch.setattr(aligner.report, 'save_plot', recorded)
+    index = pd.date_range('2021-11-18 04:38:31', periods=45000, freq='20ms')
+    values = 0.05 * np.random.default_rng(0).normal(size=len(index))
+    # The strongest burst is long before the stream to align starts, a weaker one is inside it
+    values[(index >= index[0] + pd.Timedelta(seconds=90)) & (index < index[0] + pd.Timedelta(seconds=91))] += 5.0
+    values[(index >= index[0] + pd.Timedelta(seconds=500)) & (index < index[0] + pd.Timedelta(seconds=501))] += 2.0
+    true_time = pd.DataFrame({'norm': values}, index=index)
+    offset = 2.5
+    covered = (index >= index[0] + pd.Timedelta(seconds=290)) & (index < index[0] + pd.Timedelta(seconds=800))
+    rcs = pd.DataFrame({'norm': values[covered]}, index=index[covered] - pd.Timedelta(seconds=offset))
+
+    images = render_session('session', true_time, {'rcs_left': rcs}, {'rcs_left': pd.Timedelta(seconds=offset)},
+                            str(tmp_path), gesture_window=60.0)
+
+    assert (tmp_path / images['rcs_left']['gesture']).exists()
+    start, end = windows['rcs_left_gesture.png']
+    assert start < 800 and end > 290
+    assert 499 < (start + end) / 2 < 502
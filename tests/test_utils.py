@@ -0,0 +1,145 @@
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aligner.utils import (col_names, epoch_to_datetime, load_csv, load_normed, load_session, norm_df, source_spec,
+                           time_window, time_window_bounds, timestamp_to_elapsed)
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('rec.csv', ('rec.csv', 1.0, None)),
+    (pathlib.Path('rec.csv'), (pathlib.Path('rec.csv'), 1.0, None)),
+    (('rec.csv', 1000), ('rec.csv', 1000, None)),
+    ((pathlib.Path('rec.csv'), 1000, ['accel_x']), (pathlib.Path('rec.csv'), 1000, ['accel_x'])),
+])
+def test_source_spec_fills_in_defaults(spec, expected):
+    assert source_spec(spec) == expected
+
+
+@pytest.mark.parametrize('processes', [False, True])
+@pytest.mark.parametrize('true_time', [None, 'rcs_left'])
+def test_load_session_norms_every_stream(write_accel_csv, processes, true_time):
+    sources = {
+        'watch': (pathlib.Path(write_accel_csv('watch.csv', 60, 25, seed=1)), 1000),
+        'rcs_left': (write_accel_csv('left.csv', 50, 64, seed=2), 1000),
+        'rcs_right': (write_accel_csv('right.csv', 70, 100, seed=3), 1000, ['accel_x', 'accel_y']),
+    }
+    true_time_data, data_to_align = load_session(sources, true_time=true_time, workers=2, processes=processes)
+
+    expected = {
+        'watch': load_normed(*sources['watch']),
+        'rcs_left': load_normed(*sources['rcs_left']),
+        'rcs_right': load_normed(*sources['rcs_right']),
+    }
+    true_time = 'watch' if true_time is None else true_time
+    pd.testing.assert_frame_equal(true_time_data, expected.pop(true_time))
+    assert list(data_to_align) == list(expected)
+    for name, data in data_to_align.items():
+        pd.testing.assert_frame_equal(data, expected[name])
+
+
+@pytest.mark.parametrize('dtype, usecols, columns', [
+    (None, None, ['accel_x', 'accel_y', 'accel_z']),
+    (np.float32, None, ['accel_x', 'accel_y', 'accel_z']),
+    (None, ['accel_z', 'accel_x'], ['accel_x', 'accel_z']),
+    (np.float32, ['accel_y'], ['accel_y']),
+])
+def test_load_csv_types_and_selects_columns(write_accel_csv, dtype, usecols, columns):
+    path = write_accel_csv('rec.csv', 20, 50, nan_fraction=0.01)
+    full = pd.read_csv(path, index_col=0)
+    loaded = load_csv(path, time_scale_to_seconds=1000, dtype=dtype, usecols=usecols)
+
+    assert list(loaded.columns) == columns
+    assert all(loaded.dtypes == np.dtype(np.float64 if dtype is None else dtype))
+    assert isinstance(loaded.index, pd.DatetimeIndex)
+    np.testing.assert_array_equal(loaded.index.as_unit('ns').asi8, full.index.to_numpy() * 10 ** 6)
+    np.testing.assert_array_equal(loaded.to_numpy(), full[columns].to_numpy().astype(loaded.dtypes.iloc[0]))
+
+
+def test_integer_epochs_convert_exactly():
+    epochs = np.array([1637207911123, 1637207911124, 1637207999999, 1637208257245], dtype=np.int64)
+    index = epoch_to_datetime(pd.Index(epochs, name='timestamp'), time_scale_to_seconds=1000)
+
+    assert index.name == 'timestamp'
+    np.testing.assert_array_equal(index.as_unit('ns').asi8, epochs * 10 ** 6)
+
+
+@pytest.mark.parametrize('epochs', [
+    np.array([1676543210 * 1024, 1676543210 * 1024 + 1, 1676543210 * 1024 + 3000], dtype=np.int64),
+    np.array([1637207911.5, 1637207911.75, 1637207912.0]),
+])
+def test_other_epochs_convert_through_seconds(epochs):
+    expected = pd.DatetimeIndex(pd.to_datetime(epochs / 1024, unit='s'))
+    pd.testing.assert_index_equal(epoch_to_datetime(epochs, time_scale_to_seconds=1024), expected)
+
+
+ELAPSED = np.array([0.0, 0.02, 0.5, 1.25, 3600.0])
+
+
+@pytest.mark.parametrize('timestamps, start', [
+    (pd.DatetimeIndex(pd.Timestamp('2021-11-18 04:38:31') + pd.to_timedelta(ELAPSED, unit='s')), None),
+    (pd.Series(pd.Timestamp('2021-11-18 04:38:31') + pd.to_timedelta(ELAPSED + 2, unit='s')),
+     pd.Timestamp('2021-11-18 04:38:33')),
+    (pd.TimedeltaIndex(pd.to_timedelta(ELAPSED, unit='s')), None),
+    (pd.to_timedelta(ELAPSED + 10, unit='s').to_numpy(), pd.Timedelta(seconds=10)),
+    (1637207911000 + np.round(ELAPSED * 1000).astype(np.int64), None),
+])
+def test_timestamp_to_elapsed_returns_float_seconds(timestamps, start):
+    elapsed = timestamp_to_elapsed(timestamps, start=start, time_scale_to_seconds=1000)
+    assert elapsed.dtype == np.float64
+    np.testing.assert_allclose(elapsed, ELAPSED)
+
+
+@pytest.fixture
+def accel():
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame(rng.normal(size=(10007, 3)), columns=['accel_x', 'accel_y', 'accel_z'],
+                         index=pd.date_range('2021-11-18', periods=10007, freq='4ms'))
+    frame['time_ms'] = np.arange(len(frame))
+    return frame
+
+
+def test_norm_df_excludes_time_columns(accel):
+    expected = np.sqrt((accel[['accel_x', 'accel_y', 'accel_z']] ** 2).sum(axis=1)).to_numpy()
+    np.testing.assert_allclose(norm_df(accel).to_numpy()[:, 0], expected)
+
+
+@pytest.mark.parametrize('chunk_size', [997, 10006, 10007, 50000])
+def test_chunked_norm_df_matches_unchunked(accel, chunk_size):
+    chunked = norm_df(accel, chunk_size=chunk_size)
+    pd.testing.assert_frame_equal(chunked, norm_df(accel))
+
+
+def test_float32_norm_df_stays_close_to_float64(accel):
+    single = norm_df(accel, dtype=np.float32)
+    assert single.dtypes.iloc[0] == np.float32
+    np.testing.assert_allclose(single.to_numpy(), norm_df(accel).to_numpy(), rtol=1e-6)
+
+
+@pytest.mark.parametrize('include, exclude, expected', [
+    ('accel', None, ['accel_x', 'accel_y', 'accel_z']),
+    ('_x', None, ['accel_x']),
+    ('accel', '_z', ['accel_x', 'accel_y']),
+    (None, 'time', ['accel_x', 'accel_y', 'accel_z', 0]),
+])
+def test_col_names_selects_matching_columns(include, exclude, expected):
+    frame = pd.DataFrame(np.zeros((2, 5)), columns=['accel_x', 'accel_y', 'accel_z', 'time_ms', 0])
+    assert list(col_names(frame, include=include, exclude=exclude)) == expected
+
+
+@pytest.mark.parametrize('t_start, t_end', [
+    (0.0, 1.0), (0.02, 0.5), (0.019, 0.021), (0.5, 0.5), (-1.0, 0.0), (99.98, 200.0), (-5.0, -1.0), (0.5, 0.3),
+])
+def test_time_window_bounds_match_a_boolean_mask(t_start, t_end):
+    # Repeated timestamps as well, as delivered in bursts after a dropout
+    time = np.sort(np.concatenate([np.arange(0, 100, 0.02), [0.5, 0.5, 0.02]]))
+    values = np.arange(len(time))
+    i0, i1 = time_window_bounds(time, t_start, t_end)
+
+    mask = (time > t_start) & (time <= t_end)
+    np.testing.assert_array_equal(np.arange(len(time))[i0:i1], np.flatnonzero(mask))
+    window_time, window_values = time_window(time, values, t_start, t_end)
+    np.testing.assert_array_equal(window_time, time[mask])
+    np.testing.assert_array_equal(window_values, values[mask])